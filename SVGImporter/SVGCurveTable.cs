@@ -0,0 +1,114 @@
+using System.IO;
+using System.Text;
+using UnityEngine;
+
+namespace SVGImporter
+{
+    // Plays the .table.bytes baked by swf2unity --tables: every depth's
+    // position, scale, euler, active and frame are read by frame index
+    // instead of evaluating the .anim curves.
+    [AddComponentMenu("Rendering/SVG Curve Table", 21)]
+    public class SVGCurveTable : MonoBehaviour
+    {
+        public const int CHANNELS = 7;
+        // curve types mask bits, as AnimType in model.py
+        public const int POSITION = 1 << 0;
+        public const int SCALE = 1 << 1;
+        public const int EULER = 1 << 2;
+        public const int ISACTIVE = 1 << 3;
+        public const int FRAME = 1 << 4;
+
+        public TextAsset table;
+        public float time;
+        public float speed = 1f;
+        public bool loop = true;
+
+        protected int _frameCount;
+        protected float _frameRate;
+        protected Transform[] _depths;
+        protected SVGFrameRenderer[] _renderers;
+        protected int[] _masks;
+        protected float[][] _values;
+        protected int _lastFrame = -1;
+
+        public int frameCount
+        {
+            get { return _frameCount; }
+        }
+
+        public float frameRate
+        {
+            get { return _frameRate; }
+        }
+
+        void Awake()
+        {
+            if (table != null) Load();
+        }
+
+        public void Load()
+        {
+            using (BinaryReader reader = new BinaryReader(new MemoryStream(table.bytes)))
+            {
+                if (Encoding.ASCII.GetString(reader.ReadBytes(4)) != "SWFT" || reader.ReadUInt16() != 1)
+                {
+                    Debug.LogError("SVGCurveTable: " + table.name + " is not a curve table");
+                    return;
+                }
+                int depths = reader.ReadUInt16();
+                _frameCount = (int)reader.ReadUInt32();
+                _frameRate = reader.ReadSingle();
+                _depths = new Transform[depths];
+                _renderers = new SVGFrameRenderer[depths];
+                _masks = new int[depths];
+                _values = new float[depths][];
+                for (int d = 0; d < depths; d++)
+                {
+                    reader.ReadUInt16();
+                    _masks[d] = reader.ReadUInt16();
+                    string path = Encoding.UTF8.GetString(reader.ReadBytes(reader.ReadUInt16()));
+                    _depths[d] = transform.Find(path);
+                    if (_depths[d] != null) _renderers[d] = _depths[d].GetComponent<SVGFrameRenderer>();
+                    byte[] bytes = reader.ReadBytes(_frameCount * CHANNELS * 4);
+                    _values[d] = new float[_frameCount * CHANNELS];
+                    System.Buffer.BlockCopy(bytes, 0, _values[d], 0, bytes.Length);
+                }
+            }
+            _lastFrame = -1;
+        }
+
+        void Update()
+        {
+            if (_values == null || _frameCount == 0) return;
+            time += Time.deltaTime * speed;
+            int f = Mathf.FloorToInt(time * _frameRate);
+            f = loop ? ((f % _frameCount) + _frameCount) % _frameCount : Mathf.Clamp(f, 0, _frameCount - 1);
+            Sample(f);
+        }
+
+        public void Sample(int f)
+        {
+            if (f == _lastFrame) return;
+            for (int d = 0; d < _depths.Length; d++)
+            {
+                Transform depth = _depths[d];
+                if (depth == null) continue;
+                float[] values = _values[d];
+                int mask = _masks[d];
+                int i = f * CHANNELS;
+                // only what the .anim animates, z is left alone
+                if ((mask & POSITION) != 0)
+                    depth.localPosition = new Vector3(values[i], values[i + 1], depth.localPosition.z);
+                if ((mask & SCALE) != 0)
+                    depth.localScale = new Vector3(values[i + 2], values[i + 3], depth.localScale.z);
+                if ((mask & EULER) != 0)
+                    depth.localEulerAngles = new Vector3(0f, 0f, values[i + 4]);
+                if ((mask & ISACTIVE) != 0 && depth.gameObject.activeSelf != (values[i + 5] != 0f))
+                    depth.gameObject.SetActive(values[i + 5] != 0f);
+                if ((mask & FRAME) != 0 && _renderers[d] != null)
+                    _renderers[d].frame = values[i + 6];
+            }
+            _lastFrame = f;
+        }
+    }
+}
@@ -25,6 +25,12 @@ namespace SVGImporter
         
         protected Dictionary<int, SVGLayer> frames = null;
 
+        public float frame
+        {
+            get { return _frame; }
+            set { _frame = value; }
+        }
+
         protected override void PrepareForRendering(bool force = false)
         {
             if (_lastFrame != _frame) base.PrepareForRendering(true);
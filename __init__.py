@@ -1,11 +1,12 @@
 import os
-import shutil
 import logging
 
-from config import SWF_FILE, ANIM_TEMPLATE, TERMINAL_LOG_LEVEL
+from config import SWF_FILE, ANIM_TEMPLATE, TERMINAL_LOG_LEVEL, DUMP_INVENTORY
 from swf_doc import SWFDocument
 from svg import SVGDocument
 from anim import AnimDocument
+from dump import InventoryDump
+from sink import DirectorySink
 from config import ANIM_TEMPLATE, DEPTH_NAMES
 
 # Logging
@@ -23,9 +24,7 @@ rootFolder = os.path.dirname(os.path.abspath(__file__))
 outFolder = '{}/{}'.format(rootFolder,alias)
 logging.info('\t<root folder>\t"{}"'.format(rootFolder))
 logging.info('\t<output folder>\t"{}"'.format(outFolder))
-if os.path.exists(outFolder):
-    shutil.rmtree(outFolder)
-os.makedirs(outFolder)
+sink = DirectorySink(outFolder)
 
 # Logfile
 logfile = logging.FileHandler('{}/{}/conversion.log'.format(rootFolder, alias))
@@ -46,8 +45,14 @@ swf = SWFDocument("{}/{}".format(rootFolder, SWF_FILE))
 svg = SVGDocument(swf)
 logger.setLevel(logging.DEBUG)
 anim = AnimDocument(swf, svg)
-svg.export(outFolder)
-anim.export(rootFolder, outFolder)
+svg.export(sink)
+anim.export(rootFolder, sink)
+swf.report.save(sink)
+if DUMP_INVENTORY:
+    dump = InventoryDump(sink)
+    for document in (swf, svg, anim):
+        document.dumpInventory(dump)
+    dump.close()
 quit()
 
 quit()
@@ -1,9 +1,23 @@
+import os
+import json
+import struct
 import logging
 import yaml
-
-from config import ANIM_TEMPLATE, FRAMEKEYFRAME
-from model import AnimType
+from array import array
+from io import BytesIO
+from copy import copy, deepcopy
+from bisect import bisect_right
+from numpy import zeros
+try:
+    from yaml import CSafeLoader as SafeLoader, CDumper as Dumper
+except ImportError:
+    from yaml import SafeLoader, Dumper
+
+from config import ANIM_TEMPLATE, FRAMEKEYFRAME, curve_tolerance, unit_divisor
+from model import AnimType, TMatrixArray
 from swf_doc import SWFDocument
+from cache import ConversionCache
+from report import timed
 
 class AnimDocument(object):
 
@@ -11,12 +25,33 @@ class AnimDocument(object):
         SINGLE_SVG = 0
         MULTI_SVG = 1
 
+    # transforms decomposed at once while streaming the timeline
+    BATCH = 4096
+
+    # baked curve tables: columns of each curve type in a depth's
+    # (frameCount, 7) float32 table, see exportTables
+    TABLE_MAGIC = b'SWFT'
+    TABLE_VERSION = 1
+    TABLE_COLUMNS = {
+        AnimType.POSITION: (0, 2),
+        AnimType.SCALE: (2, 4),
+        AnimType.EULER: (4, 5),
+        AnimType.ISACTIVE: (5, 6),
+        AnimType.FRAME: (6, 7)
+    }
+
     class Curve(object):
         def __init__(self, type, object):
             self.type = type
             self.object = object
             self.keyframes = list()
+            self.times = list()
+            self.index = dict()
             self.timeline = None
+            # times of the keyframes dropped by addKeyframe, each one equal to
+            # the keyframe kept before it; only pruned while keyframes come in order
+            self.pruned = array('d')
+            self.ordered = True
         def dump(self):
             dump = dict({'curve':dict()})
             dump['curve']['serializedVersion'] = 2
@@ -36,12 +71,47 @@ class AnimDocument(object):
             return dump
 
         def addKeyframe(self, keyframe):
+            #a keyframe before the last one can split the runs pruned so far
+            if len(self.times) and keyframe.time < self.times[-1]:
+                self.restore()
             #replace keyframes of the same type on the same time
-            for k, key in enumerate(self.keyframes):
-                if (type(key) == type(keyframe) and key.time == keyframe.time):
-                    self.keyframes[k].set(keyframe)
-                    return
-            self.keyframes.append(keyframe)
+            key = (type(keyframe), keyframe.time)
+            if key in self.index:
+                self.index[key].set(keyframe)
+                return
+            self.index[key] = keyframe
+            #keep keyframes sorted by time (append if in order)
+            if not len(self.times) or keyframe.time >= self.times[-1]:
+                #keyframes in order: the last one can't change anymore, drop the
+                #one before it if it's inside a run of equal keyframes (see optimize)
+                if self.ordered and len(self.keyframes) > 2 and self.keyframes[-3].equals(self.keyframes[-2]) and self.keyframes[-2].equals(self.keyframes[-1]):
+                    self.pruned.append(self.times[-2])
+                    del self.index[(type(self.keyframes[-2]), self.times[-2])]
+                    del self.keyframes[-2]
+                    del self.times[-2]
+                self.times.append(keyframe.time)
+                self.keyframes.append(keyframe)
+            else:
+                k = bisect_right(self.times, keyframe.time)
+                self.times.insert(k, keyframe.time)
+                self.keyframes.insert(k, keyframe)
+
+        def restore(self):
+            #put the pruned keyframes back, as copies of the keyframe before
+            #them, and stop pruning: optimize sees every keyframe
+            self.ordered = False
+            for time in self.pruned:
+                k = bisect_right(self.times, time)
+                keyframe = copy(self.keyframes[k-1])
+                keyframe.time = time
+                self.index[(type(keyframe), time)] = keyframe
+                self.times.insert(k, time)
+                self.keyframes.insert(k, keyframe)
+            self.pruned = array('d')
+
+        def reindex(self):
+            self.times = [k.time for k in self.keyframes]
+            self.index = dict(((type(k), k.time), k) for k in self.keyframes)
 
         def hasKeyframes(self):
             return len(self.keyframes) > 0
@@ -53,21 +123,20 @@ class AnimDocument(object):
                 first = self.keyframes[0]
                 if (first.time > 0):
                     if (self.type == AnimType.ISACTIVE and first.active != 0):
-                        default = IsActiveKeyframe(0,0).set(first)
+                        default = AnimDocument.IsActiveKeyframe(0, SWFDocument.Transform(0, None, None))
                         self.keyframes.insert(0,default)
 
-            # find and remove repeated keyframes
-            repeated = []
-            for k, keyframe in enumerate(self.keyframes[1:]):
-                if keyframe.equals(self.keyframes[k]):
-                    repeated.append(keyframe)
-            todelete = []
+            # find and remove repeated keyframes in a single pass:
+            # inside a run of equal keyframes only the first and last are kept
+            keyframes = []
+            last = len(self.keyframes)-1
+            repeated = False
             for k, keyframe in enumerate(self.keyframes):
-                if keyframe in repeated:
-                    if (k < len(self.keyframes)-1):
-                        if self.keyframes[k+1] in repeated:
-                            todelete.append(keyframe)
-            self.keyframes = [k for k in self.keyframes if k not in todelete]
+                nextRepeated = k < last and self.keyframes[k+1].equals(keyframe)
+                if not (repeated and nextRepeated):
+                    keyframes.append(keyframe)
+                repeated = nextRepeated
+            self.keyframes = keyframes
 
             # if two keyframes only and they're equal, remove the last
             if len(self.keyframes) == 2:
@@ -79,13 +148,72 @@ class AnimDocument(object):
                 if (self.keyframes[0].default()):
                     del(self.keyframes[0])
 
+            self.reindex()
+
+        def reduce(self, epsilon):
+            # Ramer-Douglas-Peucker over time: drop keyframes that the linear
+            # interpolation of their kept neighbours rebuilds within epsilon
+            if self.type not in (AnimType.POSITION, AnimType.SCALE, AnimType.EULER): return
+            if [k for k in self.keyframes if k.discrete]: return
+
+            keyframes = self.keyframes
+            if len(keyframes) > 2:
+                keep = [False]*len(keyframes)
+                keep[0] = keep[-1] = True
+                segments = [(0, len(keyframes)-1)]
+                while len(segments):
+                    a, b = segments.pop()
+                    va, vb = keyframes[a].values(), keyframes[b].values()
+                    worst, error = None, epsilon
+                    for k in range(a+1, b):
+                        t = (keyframes[k].time - keyframes[a].time)/(keyframes[b].time - keyframes[a].time)
+                        v = keyframes[k].values()
+                        e = max([abs(va[c] + (vb[c]-va[c])*t - v[c]) for c in range(len(v))])
+                        if e > error:
+                            worst, error = k, e
+                    if worst != None:
+                        keep[worst] = True
+                        segments.append((a, worst))
+                        segments.append((worst, b))
+                keyframes = [k for k, kept in zip(keyframes, keep) if kept]
+
+            # linear tangents, so Unity's hermite evaluation matches the reduction
+            slopes = [keyframes[k].slope(keyframes[k+1]) for k in range(len(keyframes)-1)]
+            for k, keyframe in enumerate(keyframes):
+                if not len(slopes): break
+                keyframe.inSlope = slopes[k-1] if k > 0 else slopes[0]
+                keyframe.outSlope = slopes[k] if k < len(slopes) else slopes[-1]
+
+            self.keyframes = keyframes
+            self.reindex()
+
+        def evaluate(self, time):
+            # the value Unity gives the curve at time: hermite segments,
+            # steps after discrete keyframes, clamped outside the keyframes
+            k = bisect_right(self.times, time)
+            if k == 0: return self.keyframes[0].values()
+            a = self.keyframes[k-1]
+            if k == len(self.keyframes) or a.time == time: return a.values()
+            b = self.keyframes[k]
+            if a.discrete or b.discrete: return a.values()
+            dt = b.time - a.time
+            t = (time - a.time)/dt
+            outSlope = a.outSlope if a.outSlope != None else [0]*len(a.values())
+            inSlope = b.inSlope if b.inSlope != None else [0]*len(b.values())
+            h00, h10, h01, h11 = 2*t**3 - 3*t**2 + 1, t**3 - 2*t**2 + t, -2*t**3 + 3*t**2, t**3 - t**2
+            return [h00*p0 + h10*dt*m0 + h01*p1 + h11*dt*m1 for p0, m0, p1, m1 in zip(a.values(), outSlope, b.values(), inSlope)]
+
         def __str__(self):
             return "[{}|{}]".format(self.object.name, AnimType.Name(self.type))
 
     class Keyframe (object):
+        # a clip holds a keyframe per frame and curve until optimized
+        __slots__ = ('time', 'discrete', 'inSlope', 'outSlope')
         def __init__(self, time, discrete = False):
             self.time = time
             self.discrete = discrete
+            self.inSlope = None
+            self.outSlope = None
         def dump(self):
             dump = dict()
             dump['serializedVersion'] = 2
@@ -95,11 +223,23 @@ class AnimDocument(object):
                 dump['inSlope'] = dict({'x': 'Infinity', 'y': 'Infinity', 'z': 'Infinity'})
                 dump['outSlope'] = dict({'x': 'Infinity', 'y': 'Infinity', 'z': 'Infinity'})
                 dump['tangentMode'] = 103
+            elif (self.inSlope != None):
+                # broken linear tangents
+                dump['inSlope'] = self.dumpSlope(self.inSlope)
+                dump['outSlope'] = self.dumpSlope(self.outSlope)
+                dump['tangentMode'] = 69
             else:
                 dump['inSlope'] = dict({'x': 0, 'y': 0, 'z': 0})
                 dump['outSlope'] = dict({'x': 0, 'y': 0, 'z': 0})
                 dump['tangentMode'] = 0
             return dump
+        def dumpSlope(self, slope):
+            return dict({'x': 0, 'y': 0, 'z': 0})
+        def values(self):
+            return []
+        def slope(self, next):
+            dt = next.time - self.time
+            return [(b - a)/dt for a, b in zip(self.values(), next.values())]
         def set(self, keyframe):
             keyframe.time = self.time
             return self
@@ -111,15 +251,28 @@ class AnimDocument(object):
             return None
 
     class PositionKeyframe(Keyframe):
-        def __init__(self, time, transform, discrete = False):
-            assert hasattr(transform, 'matrix') and transform.matrix != None
-            self.position = transform.matrix.getPosition()
+        __slots__ = ('x', 'y')
+        def __init__(self, time, transform, discrete = False, position = None):
+            if position == None:
+                assert hasattr(transform, 'matrix') and transform.matrix != None
+                position = transform.matrix.getPosition()
+            self.position = position
             super(AnimDocument.PositionKeyframe, self).__init__(time, discrete)
+        @property
+        def position(self):
+            return [self.x, self.y]
+        @position.setter
+        def position(self, position):
+            self.x, self.y = position
         def dump(self):
             dump = super(AnimDocument.PositionKeyframe, self).dump()
             dump['value']['x'] = self.position[0]
             dump['value']['y'] = -self.position[1]
             return dump
+        def dumpSlope(self, slope):
+            return dict({'x': slope[0], 'y': -slope[1], 'z': 0})
+        def values(self):
+            return self.position
         def set(self, keyframe):
             dump = super(AnimDocument.PositionKeyframe, self).set(keyframe)
             self.position = keyframe.position
@@ -132,15 +285,28 @@ class AnimDocument(object):
             return self.position == [0,0]
 
     class ScaleKeyframe(Keyframe):
-        def __init__(self, time, transform, discrete = False):
-            assert hasattr(transform, 'matrix') and transform.matrix != None
-            self.scale = transform.matrix.getScale()
+        __slots__ = ('x', 'y')
+        def __init__(self, time, transform, discrete = False, scale = None):
+            if scale == None:
+                assert hasattr(transform, 'matrix') and transform.matrix != None
+                scale = transform.matrix.getScale()
+            self.scale = scale
             super(AnimDocument.ScaleKeyframe, self).__init__(time, discrete)
+        @property
+        def scale(self):
+            return [self.x, self.y]
+        @scale.setter
+        def scale(self, scale):
+            self.x, self.y = scale
         def dump(self):
             dump = super(AnimDocument.ScaleKeyframe, self).dump()
             dump['value']['x'] = self.scale[0]
             dump['value']['y'] = self.scale[1]
             return dump
+        def dumpSlope(self, slope):
+            return dict({'x': slope[0], 'y': slope[1], 'z': 0})
+        def values(self):
+            return self.scale
         def set(self, keyframe):
             dump = super(AnimDocument.ScaleKeyframe, self).set(keyframe)
             self.scale = keyframe.scale
@@ -153,14 +319,21 @@ class AnimDocument(object):
             return self.scale == [1,1]
 
     class EulerKeyframe(Keyframe):
-        def __init__(self, time, transform, discrete = False):
-            assert hasattr(transform, 'matrix') and transform.matrix != None
-            self.euler = transform.matrix.getEuler()
+        __slots__ = ('euler',)
+        def __init__(self, time, transform, discrete = False, euler = None):
+            if euler == None:
+                assert hasattr(transform, 'matrix') and transform.matrix != None
+                euler = transform.matrix.getEuler()
+            self.euler = euler
             super(AnimDocument.EulerKeyframe, self).__init__(time, discrete)
         def dump(self):
             dump = super(AnimDocument.EulerKeyframe, self).dump()
             dump['value']['z'] = self.euler
             return dump
+        def dumpSlope(self, slope):
+            return dict({'x': 0, 'y': 0, 'z': slope[0]})
+        def values(self):
+            return [self.euler]
         def set(self, keyframe):
             dump = super(AnimDocument.EulerKeyframe, self).set(keyframe)
             self.euler = keyframe.euler
@@ -173,6 +346,7 @@ class AnimDocument(object):
             return self.euler == 0
 
     class IsActiveKeyframe(Keyframe):
+        __slots__ = ('active',)
         def __init__(self, time, transform, discrete = True):
             super(AnimDocument.IsActiveKeyframe, self).__init__(time, True)
             self.active = 1.0 if transform.char != None else 0.0
@@ -182,6 +356,8 @@ class AnimDocument(object):
             dump['inSlope'] = 'Infinity'
             dump['outSlope'] = 'Infinity'
             return dump
+        def values(self):
+            return [self.active]
         def set(self, keyframe):
             dump = super(AnimDocument.IsActiveKeyframe, self).set(keyframe)
             self.active = keyframe.active
@@ -194,6 +370,7 @@ class AnimDocument(object):
             return self.active == 1.0
 
     class FrameKeyframe(Keyframe):
+        __slots__ = ('f',)
         def __init__(self, time, f, discrete = True):
             super(AnimDocument.FrameKeyframe, self).__init__(time, True)
             self.f = f
@@ -203,6 +380,8 @@ class AnimDocument(object):
             dump['inSlope'] = 'Infinity'
             dump['outSlope'] = 'Infinity'
             return dump
+        def values(self):
+            return [self.f]
         def set(self, keyframe):
             dump = super(AnimDocument.FrameKeyframe, self).set(keyframe)
             self.f = keyframe.f
@@ -231,6 +410,122 @@ class AnimDocument(object):
         def getStopTime(self):
                 return (self.anim.frameCount-1)/self.anim.frameRate
 
+    class Template(object):
+        # parsed templates by path: (mtime, document)
+        cache = {}
+
+        @staticmethod
+        def load(path):
+            mtime = os.path.getmtime(path)
+            cached = AnimDocument.Template.cache.get(path)
+            if cached == None or cached[0] != mtime:
+                logging.info("<Anim> Parsing template file {}".format(path))
+                anim_template = open(path, 'r')
+                try:
+                    cached = (mtime, yaml.load(anim_template, Loader=SafeLoader))
+                except yaml.YAMLError as exc:
+                    logging.error(exc)
+                    raise
+                finally:
+                    anim_template.close()
+                AnimDocument.Template.cache[path] = cached
+            # every export edits its own copy
+            return deepcopy(cached[1])
+
+    class Writer(object):
+        """
+        Streams an AnimationClip to a Unity .anim file, curve by curve, with
+        the same block layout yaml.dump gives the whole clip (sorted keys,
+        indentless sequences, PyYAML scalar formatting).
+        """
+        HEADER = "%YAML 1.1\n%TAG !u! tag:unity3d.com,2011:\n--- !u!74 &0\n"
+
+        def __init__(self, file, onCurve = None):
+            self.file = file
+            self.strings = {}
+            # onCurve(curve, tag, text) gets the text written for every curve
+            self.onCurve = onCurve
+
+        def write(self, data, curves):
+            # curves: {key: {curves key: [Curve]}}, dumped only when reached
+            self.mapping(data, 0, curves)
+
+        def scalar(self, value):
+            if value is None:
+                return 'null'
+            elif value is True or value is False:
+                return 'true' if value else 'false'
+            elif isinstance(value, float):
+                if value != value: return '.nan'
+                elif value == float('inf'): return '.inf'
+                elif value == -float('inf'): return '-.inf'
+                text = repr(value).lower()
+                if '.' not in text and 'e' in text:
+                    text = text.replace('e', '.0e', 1)
+                return text
+            elif isinstance(value, int):
+                return str(value)
+            # strings may need quoting; let yaml decide once per value
+            if value not in self.strings:
+                text = yaml.dump(value, Dumper=Dumper)
+                if text.endswith('\n...\n'): text = text[:-4]
+                self.strings[value] = text.rstrip('\n')
+            return self.strings[value]
+
+        def mapping(self, data, indent, lazy = {}, first = None):
+            for key in sorted(data.keys()):
+                value = data[key]
+                prefix = (first if first != None else ' '*indent) + self.scalar(key) + ':'
+                first = None
+                if key in lazy and isinstance(value, dict):
+                    self.file.write('{}\n'.format(prefix))
+                    self.mapping(value, indent+2, lazy[key])
+                elif key in lazy and len(lazy[key]):
+                    self.file.write('{}\n'.format(prefix))
+                    for curve in lazy[key]:
+                        self.curve(curve, key, indent)
+                else:
+                    self.value(prefix, value, indent)
+
+        def curve(self, curve, tag, indent):
+            # already serialized (cached) curve
+            if isinstance(curve, str):
+                self.file.write(curve)
+            elif self.onCurve == None:
+                self.item(curve.dump(), indent)
+            else:
+                file = self.file
+                self.file = BytesIO()
+                self.item(curve.dump(), indent)
+                text = self.file.getvalue()
+                self.file = file
+                self.file.write(text)
+                self.onCurve(curve, tag, text)
+
+        def value(self, prefix, value, indent):
+            if isinstance(value, dict):
+                if not len(value):
+                    self.file.write('{} {{}}\n'.format(prefix))
+                else:
+                    self.file.write('{}\n'.format(prefix))
+                    self.mapping(value, indent+2)
+            elif isinstance(value, list):
+                if not len(value):
+                    self.file.write('{} []\n'.format(prefix))
+                else:
+                    self.file.write('{}\n'.format(prefix))
+                    for item in value:
+                        self.item(item, indent)
+            else:
+                self.file.write('{} {}\n'.format(prefix, self.scalar(value)))
+
+        def item(self, value, indent):
+            prefix = ' '*indent + '-'
+            if isinstance(value, dict) and len(value):
+                self.mapping(value, indent+2, first = prefix + ' ')
+            else:
+                self.value(prefix, value, indent+2)
+
     class GameObject(object):
         def __init__(self, id, name):
             self.id = id
@@ -247,15 +542,41 @@ class AnimDocument(object):
                     if next != None: return [object] + next
             return None
 
-    def __init__(self, swf, svg, type = Type.MULTI_SVG):
+    def __init__(self, swf, svg, type = Type.MULTI_SVG, cache = None, tables = False):
         self.swf = swf
         self.svg = svg
+        self.report = swf.report
         self.type = type
         self.frameRate = self.swf.frameRate
         self.frameCount = self.swf.frameCount
         self.timeline = AnimDocument.Timeline(self)
+        self.cache = cache
+        # the tables are baked from curves, cached depths get them too
+        self.tables = tables
+        self.depthKeys = {}
+        # depth id -> {curves tag: [curve text]} reused from the cache
+        self.cached = {}
         self.parse()
 
+    def getDepthKeys(self):
+        # hash of everything the curves of a depth are made of: the settings
+        # and its resolved placement stream (frame, transform, char, matrix)
+        hashes = {}
+        for depth in self.swf.depths.values():
+            hashes[depth.id] = ConversionCache.hash()
+            for part in [depth.name, [c.id for c in depth.charHistory], self.frameRate, self.frameCount,
+                            unit_divisor, curve_tolerance, FRAMEKEYFRAME.ATTRIBUTE, FRAMEKEYFRAME.GUID]:
+                ConversionCache.update(hashes[depth.id], part)
+        for f, transforms in self.swf.parse():
+            for t in transforms:
+                matrix = t.matrix.matrix if getattr(t, 'matrix', None) != None else None
+                ConversionCache.update(hashes[t.depth.id], (f, t.__class__.__name__, t.char != None, matrix))
+        return dict((depth, hashes[depth].hexdigest()) for depth in hashes)
+
+    def getKey(self):
+        return ConversionCache.key([self.swf.alias] + sorted(self.depthKeys.items()))
+
+    @timed('anim.parse')
     def parse(self):
 
         logging.info("<Anim> Parsing SVGDocument")
@@ -265,76 +586,99 @@ class AnimDocument(object):
         objects = AnimDocument.GameObject(0,'root')
         for depth in self.swf.depths.values():
             objects.addChild(AnimDocument.GameObject(depth.id, depth.name))
+        self.objects = objects
+
+        # Reuse the curves of unchanged depths
+        if self.cache != None:
+            self.depthKeys = self.getDepthKeys()
+            for depth, key in self.depthKeys.items():
+                curves = self.cache.getObject(key)
+                if curves != None:
+                    self.cached[depth] = curves
+            logging.info("<Anim> Reusing curves of {}/{} depths from cache".format(len(self.cached), len(self.depthKeys)))
+            self.report.set('anim.cachedDepths', len(self.cached))
 
         logging.info("<Anim> Populating curves with keyframes...")
 
-        # Populate curves with keyframes
-        for f, frame in enumerate(self.swf.frames):
-            for transform in frame:
-                time = f/self.swf.frameRate
-                object = objects.byId(transform.depth.id)[0]
-                discrete = len(transform.depth.charHistory) > 1
-
-                if isinstance(transform,SWFDocument.MatrixTransform):
-
-                    try:
-                        # Position
-                        positionKeyframe = AnimDocument.PositionKeyframe(time, transform, discrete)
-                        self.timeline.addKeyframe(object, positionKeyframe)
-                    except AssertionError, e: pass
-                    try:
-                        # Position
-                        scaleKeyframe = AnimDocument.ScaleKeyframe(time, transform, discrete)
-                        self.timeline.addKeyframe(object, scaleKeyframe)
-                    except AssertionError, e: pass
-                    try:
-                        # Position
-                        eulerKeyframe = AnimDocument.EulerKeyframe(time, transform, discrete)
-                        self.timeline.addKeyframe(object, eulerKeyframe)
-                    except AssertionError, e: pass
-
-                # Active frame
-                try:
-                    isActiveKeyframe = AnimDocument.IsActiveKeyframe(time, transform, discrete)
-                    self.timeline.addKeyframe(object, isActiveKeyframe)
-                except AssertionError, e: pass
+        # Stream the timeline, decomposing the matrices of a batch of frames at once
+        batch = []
+        for f, transforms in self.swf.parse():
+            batch += [t for t in transforms if self.tables or t.depth.id not in self.cached]
+            if len(batch) >= AnimDocument.BATCH:
+                self.addTransforms(batch)
+                batch = []
+        self.addTransforms(batch)
 
-                # FrameKeyframe
-                # if layer has more than one frame, add a frameKeyframe to it
-                if (discrete):
-                    try:
-                        frame = transform.depth.childHistory.index(transform.f)
-                        frameKeyframe = AnimDocument.FrameKeyframe(time, frame, discrete)
-                        self.timeline.addCurveKeyframe(object, frameKeyframe)
-                    except AssertionError, e: pass
+        self.optimize()
 
+    @timed('anim.optimize')
+    def optimize(self):
         logging.info('<Anim> Optmizing curves...')
         c_before = sum([1 for c in self.timeline.curves])
-        k_before = sum([sum([1 for k in c.keyframes]) for c in self.timeline.curves.values()])
+        # keyframes pruned while streaming count as before optimize
+        k_pruned = sum([len(c.pruned) for c in self.timeline.curves.values()])
+        k_before = sum([sum([1 for k in c.keyframes]) for c in self.timeline.curves.values()]) + k_pruned
 
         for curve in self.timeline.curves.values():
             curve.optimize()
+            if curve_tolerance > 0:
+                curve.reduce(curve_tolerance)
         self.timeline.curves = {c:self.timeline.curves[c] for c in self.timeline.curves if self.timeline.curves[c].hasKeyframes()}
 
         c_after = sum([1 for c in self.timeline.curves])
         k_after = sum([sum([1 for k in c.keyframes]) for c in self.timeline.curves.values()])
         logging.info('<Anim> before: {} curves / {} keyframes'.format(c_before, k_before))
         logging.info('<Anim> after: {} curves / {} keyframes'.format(c_after, k_after))
+        self.report.set('anim.curves.before', c_before)
+        self.report.set('anim.keyframes.before', k_before)
+        self.report.set('anim.keyframes.pruned', k_pruned)
+        self.report.set('anim.curves.after', c_after)
+        self.report.set('anim.keyframes.after', k_after)
+
+    def addTransforms(self, transforms):
+        matrices = TMatrixArray.fromTransforms([t for t in transforms if isinstance(t,SWFDocument.MatrixTransform) and t.matrix != None])
+        positions = matrices.getPosition().tolist()
+        scales = matrices.getScale().tolist()
+        eulers = matrices.getEuler().tolist()
+        m = 0
 
-        logging.debug('<Anim> Curves:')
-        for curve in self.timeline.curves.values():
-            logging.debug('\t{}'.format(curve))
-            for keyframe in curve.keyframes:
-                logging.debug('\t\t{}'.format(keyframe))
-
-    def export(self, rootFolder, folder):
-        ## Debug Output
-        logging.info("<Anim> Parsing template file {}/{}".format(rootFolder, ANIM_TEMPLATE))
-        anim_template = open("{}/{}".format(rootFolder, ANIM_TEMPLATE), 'r')
-        try:
-            anim = yaml.load(anim_template)
-        except yaml.YAMLError as exc:
-            logging.error(exc)
+        # Populate curves with keyframes
+        for transform in transforms:
+            time = transform.f/self.swf.frameRate
+            object = self.objects.byId(transform.depth.id)[0]
+            discrete = len(transform.depth.charHistory) > 1
+
+            if isinstance(transform,SWFDocument.MatrixTransform) and transform.matrix != None:
+
+                # Position
+                positionKeyframe = AnimDocument.PositionKeyframe(time, transform, discrete, positions[m])
+                self.timeline.addKeyframe(object, positionKeyframe)
+                # Scale
+                scaleKeyframe = AnimDocument.ScaleKeyframe(time, transform, discrete, scales[m])
+                self.timeline.addKeyframe(object, scaleKeyframe)
+                # Euler
+                eulerKeyframe = AnimDocument.EulerKeyframe(time, transform, discrete, eulers[m])
+                self.timeline.addKeyframe(object, eulerKeyframe)
+                m += 1
+
+            # Active frame
+            try:
+                isActiveKeyframe = AnimDocument.IsActiveKeyframe(time, transform, discrete)
+                self.timeline.addKeyframe(object, isActiveKeyframe)
+            except AssertionError, e: pass
+
+            # FrameKeyframe
+            # if layer has more than one frame, add a frameKeyframe to it
+            if (discrete):
+                try:
+                    frame = transform.depth.childHistory.index(transform.f)
+                    frameKeyframe = AnimDocument.FrameKeyframe(time, frame, discrete)
+                    self.timeline.addCurveKeyframe(object, frameKeyframe)
+                except AssertionError, e: pass
+
+    @timed('anim.export')
+    def export(self, rootFolder, sink, stream = True):
+        anim = AnimDocument.Template.load("{}/{}".format(rootFolder, ANIM_TEMPLATE))
 
         # Set template sample/frame rate
         anim['AnimationClip']['m_Name'] = self.swf.alias
@@ -352,7 +696,9 @@ class AnimDocument(object):
         anim['AnimationClip']['m_FloatCurves'] = []
 
         # Merge curves into template
+        curves = {}
         for curve in self.timeline.curves.values():
+            if curve.object.id in self.cached: continue
             type = ''
             tag = ''
             if (curve.type == AnimType.POSITION):
@@ -364,10 +710,82 @@ class AnimDocument(object):
             elif (curve.type == AnimType.ISACTIVE or curve.type == AnimType.FRAME):
                 tag = 'm_FloatCurves'
 
-            logging.debug('<Anim> Merging {} into template'.format(curve))
-            anim['AnimationClip'][tag].append(curve.dump())
+            curves.setdefault(tag, []).append(curve)
+
+        # cached curves are already serialized, only the writer can take them
+        generated = {}
+        def onCurve(curve, tag, text):
+            generated.setdefault(curve.object.id, {}).setdefault(tag, []).append(text)
+        for depth in self.cached:
+            for tag in self.cached[depth]:
+                curves.setdefault(tag, []).extend(self.cached[depth][tag])
 
         logging.info("<Anim> Exporting animation to {}.anim".format(self.swf.alias))
-        anim_file = open('{}/{}.anim'.format(folder,self.swf.alias), 'wb')
-        anim_file.write("%YAML 1.1\n%TAG !u! tag:unity3d.com,2011:\n--- !u!74 &0\n")
-        anim_file.write(yaml.dump(anim))
+        anim_file = sink.open('{}.anim'.format(self.swf.alias))
+        anim_file.write(AnimDocument.Writer.HEADER)
+        if stream or self.cached:
+            writer = AnimDocument.Writer(anim_file, onCurve if self.cache != None else None)
+            writer.write(anim, {'AnimationClip':curves})
+            if self.cache != None:
+                for depth, key in self.depthKeys.items():
+                    if depth not in self.cached:
+                        self.cache.putObject(key, generated.get(depth, {}))
+        else:
+            for tag in curves:
+                anim['AnimationClip'][tag] = [curve.dump() for curve in curves[tag]]
+            anim_file.write(yaml.dump(anim, Dumper=Dumper))
+        self.report.set('anim.bytes', anim_file.tell())
+        anim_file.close()
+
+        # deduplicated shapes: tell which file each depth frame uses
+        if self.svg.deduplicate:
+            logging.info("<Anim> Exporting assets index to {}.assets.json".format(self.swf.alias))
+            sink.write('{}.assets.json'.format(self.swf.alias), json.dumps(self.svg.assets, indent=2, sort_keys=True))
+
+    def bake(self):
+        # every curve sampled on every frame: {depth id: (curve types mask, table)}
+        times = [f/self.frameRate for f in range(self.frameCount)]
+        tables = {}
+        for object in self.objects.children:
+            table = zeros((self.frameCount, 7), dtype='<f4')
+            table[:,2:4] = 1
+            table[:,5] = 1
+            tables[object.id] = [0, table]
+        for curve in self.timeline.curves.values():
+            start, end = AnimDocument.TABLE_COLUMNS[curve.type]
+            tables[curve.object.id][0] |= 1 << curve.type
+            tables[curve.object.id][1][:,start:end] = [curve.evaluate(time) for time in times]
+            if curve.type == AnimType.POSITION:
+                tables[curve.object.id][1][:,1] *= -1
+        return tables
+
+    @timed('anim.tables')
+    def exportTables(self, sink):
+        """
+        Writes the curves baked at the clip's frame rate to {alias}.table.bytes,
+        read by SVGCurveTable at runtime instead of evaluating the .anim:
+        header  magic 'SWFT', version (H), depths (H), frames (I), frameRate (f)
+        depth   id (H), curve types mask (H, 1 << AnimType), path length (H), path,
+                frames x [position.x, position.y, scale.x, scale.y, euler, active, frame] (f)
+        Values are in Unity's space, as written to the .anim, little endian.
+        """
+        logging.info("<Anim> Exporting curve tables to {}.table.bytes".format(self.swf.alias))
+        tables = self.bake()
+        table_file = sink.open('{}.table.bytes'.format(self.swf.alias))
+        table_file.write(struct.pack('<4sHHIf', AnimDocument.TABLE_MAGIC, AnimDocument.TABLE_VERSION,
+                                     len(tables), self.frameCount, self.frameRate))
+        for object in sorted(self.objects.children, key=lambda o: o.id):
+            mask, table = tables[object.id]
+            path = str(object.name).encode('utf-8')
+            table_file.write(struct.pack('<HHH', object.id, mask, len(path)) + path)
+            table_file.write(table.tobytes())
+        self.report.set('anim.tables.bytes', table_file.tell())
+        table_file.close()
+
+    def dumpInventory(self, dump):
+        # curves restored from the cache are already serialized, only their depth is known
+        for curve in self.timeline.curves.values():
+            dump.write('curve', object=curve.object.id, path=str(curve.object.name), curve=AnimType.Name(curve.type),
+                       keyframes=[[k.time, k.dump()['value']] for k in curve.keyframes])
+        for depth in self.cached:
+            dump.write('cached', object=depth, curves=sum(len(curves) for curves in self.cached[depth].values()))
@@ -0,0 +1,46 @@
+import os
+import sys
+import glob
+import shutil
+import logging
+import tempfile
+import timeit
+
+# Compares the streaming .anim writer against the yaml.dump path
+# usage: python benchmarks/anim_export.py [file.swf ...]
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootFolder)
+
+from swf_doc import SWFDocument
+from svg import SVGDocument
+from anim import AnimDocument
+from sink import DirectorySink
+
+REPEAT = 5
+
+logging.disable(logging.CRITICAL)
+
+files = sys.argv[1:] or sorted(glob.glob('{}/tests/*.swf'.format(rootFolder)))
+outFolder = tempfile.mkdtemp()
+try:
+    print('{:<32}{:>12}{:>12}{:>10}  {}'.format('file', 'yaml.dump', 'stream', 'speedup', 'output'))
+    for file in files:
+        try:
+            swf = SWFDocument(file)
+            anim = AnimDocument(swf, SVGDocument(swf))
+        except Exception as e:
+            print('{:<32}  skipped ({})'.format(os.path.basename(file), e))
+            continue
+        times = {}
+        outputs = {}
+        for stream in (False, True):
+            folder = '{}/{}'.format(outFolder, int(stream))
+            sink = DirectorySink(folder)
+            times[stream] = min(timeit.repeat(lambda: anim.export(rootFolder, sink, stream), number=1, repeat=REPEAT))
+            outputs[stream] = open('{}/{}.anim'.format(folder, swf.alias), 'rb').read()
+        print('{:<32}{:>11.4f}s{:>11.4f}s{:>9.1f}x  {}'.format(
+            os.path.basename(file), times[False], times[True], times[False]/times[True],
+            'identical' if outputs[False] == outputs[True] else 'DIFFERENT'))
+finally:
+    shutil.rmtree(outFolder)
@@ -0,0 +1,65 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import httplib
+import tempfile
+import subprocess
+
+# Turnaround of a conversion with swf2unity.py (a new python each time)
+# against a request to a running server.py, whose imports and template
+# are already loaded
+# usage: python benchmarks/daemon.py [file.swf ...]
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPEAT = 5
+PORT = 8643
+
+def request(method, path, body = None):
+    connection = httplib.HTTPConnection('127.0.0.1', PORT)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return data
+
+files = sys.argv[1:] or sorted(glob.glob('{}/tests/*.swf'.format(rootFolder)))
+outFolder = tempfile.mkdtemp()
+devnull = open(os.devnull, 'w')
+server = subprocess.Popen([sys.executable, '{}/server.py'.format(rootFolder), '--port', str(PORT), '-j', '1'],
+                          stdout=devnull, stderr=devnull)
+try:
+    # the server is up once it answers
+    for attempt in range(100):
+        try:
+            request('GET', '/status')
+            break
+        except Exception:
+            time.sleep(0.1)
+    print('{:<32}{:>12}{:>12}{:>10}  {}'.format('file', 'cli', 'server', 'speedup', 'conversion'))
+    for file in files:
+        file = os.path.abspath(file)
+        output = '{}/{}'.format(outFolder, os.path.splitext(os.path.basename(file))[0])
+        cli = []
+        for r in range(REPEAT):
+            start = time.time()
+            subprocess.call([sys.executable, '{}/swf2unity.py'.format(rootFolder), file, '-o', outFolder, '-j', '1'],
+                            stdout=devnull, stderr=devnull)
+            cli.append(time.time() - start)
+        served = []
+        for r in range(REPEAT):
+            start = time.time()
+            result = request('POST', '/convert', json.dumps({'file': file, 'output': output}))
+            served.append(time.time() - start)
+        if not result.get('ok'):
+            print('{:<32}  skipped ({})'.format(os.path.basename(file), result.get('error')))
+            continue
+        print('{:<32}{:>11.4f}s{:>11.4f}s{:>9.1f}x  {:.4f}s'.format(
+            os.path.basename(file), min(cli), min(served), min(cli)/min(served), result['time']))
+finally:
+    server.terminate()
+    server.wait()
+    shutil.rmtree(outFolder)
@@ -0,0 +1,63 @@
+import os
+import sys
+import glob
+import logging
+import resource
+from multiprocessing import Pool
+
+# Memory used by the timeline and curves of each file: the largest frame
+# of streamed transforms, the keyframes kept by the clip and their size,
+# and the peak RSS of a process converting only that file
+# usage: python benchmarks/memory.py [file.swf ...]
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootFolder)
+
+from swf_doc import SWFDocument
+from svg import SVGDocument
+from anim import AnimDocument
+
+logging.disable(logging.CRITICAL)
+
+def sizeof(object):
+    # the object, its __dict__ if it has one and the lists it holds
+    size = sys.getsizeof(object)
+    fields = dict(vars(object)) if hasattr(object, '__dict__') else {}
+    if hasattr(object, '__dict__'):
+        size += sys.getsizeof(object.__dict__)
+    for cls in type(object).__mro__:
+        for slot in cls.__dict__.get('__slots__', ()):
+            fields[slot] = getattr(object, slot, None)
+    return size + sum(sys.getsizeof(value) for value in fields.values() if isinstance(value, list))
+
+def measure(file):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    swf = SWFDocument(file, lazy=True)
+    anim = AnimDocument(swf, SVGDocument(swf))
+    transforms = max([len(t) for f, t in swf.parse()] or [0])
+    keyframes = [k for curve in anim.timeline.curves.values() for k in curve.keyframes]
+    return {
+        'frames': swf.frameCount,
+        'depths': len(swf.depths),
+        'transforms': transforms,
+        'keyframes': len(keyframes),
+        'bytes': sum(sizeof(k) for k in keyframes),
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    }
+
+files = sys.argv[1:] or sorted(glob.glob('{}/tests/*.swf'.format(rootFolder)))
+print('{:<32}{:>8}{:>8}{:>12}{:>11}{:>10}{:>10}{:>12}'.format('file', 'frames', 'depths', 'transforms', 'keyframes', 'bytes', 'per kf', 'rss (KB)'))
+for file in files:
+    # a fresh process per file, so the peak RSS is its own
+    pool = Pool(1)
+    try:
+        result = pool.apply(measure, (file,))
+    except Exception as e:
+        print('{:<32}  skipped ({})'.format(os.path.basename(file), e))
+        continue
+    finally:
+        pool.close()
+        pool.join()
+    print('{:<32}{:>8}{:>8}{:>12}{:>11}{:>10}{:>10.1f}{:>12}'.format(
+        os.path.basename(file), result['frames'], result['depths'], result['transforms'], result['keyframes'],
+        result['bytes'], float(result['bytes'])/max(result['keyframes'], 1), result['rss']))
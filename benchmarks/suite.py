@@ -0,0 +1,157 @@
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import resource
+import tempfile
+from multiprocessing import Pool
+
+# Times every conversion stage on the sample .swf files and on synthetic
+# ones of growing size, with the peak RSS and live object counts after
+# each stage. Results can be saved as JSON to compare two runs.
+# usage: python benchmarks/suite.py [file.swf ...] [--scale] [-o results.json]
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootFolder)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from swf_doc import SWFDocument
+from svg import SVGDocument
+from anim import AnimDocument
+from sink import DirectorySink
+import synthetic
+
+logging.disable(logging.CRITICAL)
+
+STAGES = ['swf.parse', 'svg.parse', 'svg.export', 'anim.parse', 'anim.optimize', 'anim.export']
+
+# synthetic (frames, depths, shapes), each axis doubled while the others stay put
+SCALE = [(100, 10, 10), (200, 10, 10), (400, 10, 10), (800, 10, 10),
+         (100, 20, 10), (100, 40, 10), (100, 80, 10),
+         (100, 10, 20), (100, 10, 40), (100, 10, 80)]
+
+def run(file):
+    """
+    Converts a single file, returns {stage: {time, rss, objects}} and the
+    document counts. Runs in its own process so the peak RSS is its own.
+    """
+    stages = {}
+    def measure(stage, start):
+        stages[stage] = {
+            'time': time.time() - start,
+            'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'objects': len(gc.get_objects())
+        }
+
+    folder = tempfile.mkdtemp()
+    sink = DirectorySink(folder, clean=False)
+    try:
+        start = time.time()
+        swf = SWFDocument(file, lazy=True)
+        measure('swf.parse', start)
+
+        start = time.time()
+        svg = SVGDocument(swf)
+        measure('svg.parse', start)
+
+        start = time.time()
+        files = svg.export(sink)
+        measure('svg.export', start)
+
+        start = time.time()
+        anim = AnimDocument(swf, svg)
+        measure('anim.parse', start)
+        # optimize runs inside AnimDocument.parse, the report times it on its own
+        stages['anim.optimize'] = dict(stages['anim.parse'], time=swf.report.stages['anim.optimize'])
+        stages['anim.parse']['time'] -= stages['anim.optimize']['time']
+
+        start = time.time()
+        anim.export(rootFolder, sink)
+        measure('anim.export', start)
+
+        counts = {
+            'frames': swf.frameCount,
+            'depths': len(swf.depths),
+            'shapes': len(swf.shapes),
+            'sprites': len(swf.sprites),
+            'svgs': len(files),
+            'curves': len(anim.timeline.curves),
+            'keyframes': sum(len(c.keyframes) for c in anim.timeline.curves.values()),
+            'bytes': sum(os.path.getsize('{}/{}'.format(folder, f)) for f in os.listdir(folder))
+        }
+    finally:
+        shutil.rmtree(folder)
+    return {'stages': stages, 'counts': counts}
+
+def benchmark(name, file, repeat):
+    # best time of each stage over the runs, peak values of the last one
+    result = None
+    for _ in range(repeat):
+        pool = Pool(1)
+        try:
+            current = pool.apply(run, (file,))
+        finally:
+            pool.close()
+            pool.join()
+        if result != None:
+            for stage, values in current['stages'].items():
+                values['time'] = min(values['time'], result['stages'][stage]['time'])
+        result = current
+    result['name'] = name
+    result['total'] = sum(s['time'] for s in result['stages'].values())
+    return result
+
+def report(result):
+    stages = result['stages']
+    print('{:<32}{}{:>9.3f}s{:>10}{:>10}{:>10}'.format(result['name'],
+        ''.join('{:>14.4f}'.format(stages[s]['time']) for s in STAGES), result['total'],
+        stages['anim.export']['rss'], stages['anim.export']['objects'], result['counts']['keyframes']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times every conversion stage')
+    parser.add_argument('files', nargs='*', help='.swf files (default: tests/*.swf)')
+    parser.add_argument('--scale', action='store_true', help='also run synthetic files of growing size')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per file, the best time is kept')
+    parser.add_argument('-o', '--output', help='write the results to this .json file')
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob('{}/tests/*.swf'.format(rootFolder)))
+    jobs = [(os.path.basename(file), file) for file in files]
+    syntheticFolder = tempfile.mkdtemp()
+    if args.scale:
+        for frames, depths, shapes in SCALE:
+            file = '{}/synthetic_{}f_{}d_{}s.swf'.format(syntheticFolder, frames, depths, shapes)
+            open(file, 'wb').write(synthetic.generate(frames, depths, shapes))
+            jobs.append((os.path.basename(file), file))
+
+    print('{:<32}{}{:>10}{:>10}{:>10}{:>10}'.format('file', ''.join('{:>14}'.format(s) for s in STAGES),
+        'total', 'rss (KB)', 'objects', 'keyframes'))
+    results = []
+    try:
+        for name, file in jobs:
+            try:
+                result = benchmark(name, file, args.repeat)
+            except Exception as e:
+                print('{:<32}  skipped ({}: {})'.format(name, e.__class__.__name__, e))
+                continue
+            report(result)
+            results.append(result)
+    finally:
+        shutil.rmtree(syntheticFolder)
+
+    if args.output:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results
+        }, open(args.output, 'w'), indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
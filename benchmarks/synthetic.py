@@ -0,0 +1,140 @@
+import sys
+import math
+import zlib
+import struct
+import argparse
+
+# Writes SWFs of any size, to see how the conversion scales
+# with frames, depths and shapes: every depth places one of the shapes on
+# frame 0 and moves, scales and rotates it on every following frame
+# usage: python benchmarks/synthetic.py out.swf [--frames N] [--depths N] [--shapes N]
+
+class BitWriter(object):
+    def __init__(self):
+        self.data = bytearray()
+        self.bits = 0
+        self.count = 0
+    def write(self, value, bits):
+        for b in range(bits-1, -1, -1):
+            self.bits = (self.bits << 1) | ((value >> b) & 1)
+            self.count += 1
+            if self.count == 8:
+                self.align()
+    def writeSigned(self, value, bits):
+        self.write(value & ((1 << bits) - 1), bits)
+    def align(self):
+        if self.count:
+            self.data.append(self.bits << (8 - self.count))
+        self.bits = 0
+        self.count = 0
+    def bytes(self):
+        self.align()
+        return bytes(self.data)
+
+def signedBits(*values):
+    # bits of the largest SB[] value, sign bit included
+    return max([int(abs(v)).bit_length() + 1 for v in values] + [1])
+
+def rect(writer, xmin, xmax, ymin, ymax):
+    bits = signedBits(xmin, xmax, ymin, ymax)
+    writer.write(bits, 5)
+    for v in (xmin, xmax, ymin, ymax):
+        writer.writeSigned(v, bits)
+
+def matrix(writer, scale, rotate, x, y):
+    # FB[] 16.16 fixed values
+    scale = [int(round(v * 65536)) for v in scale]
+    rotate = [int(round(v * 65536)) for v in rotate]
+    writer.write(1, 1)
+    writer.write(signedBits(*scale), 5)
+    for v in scale: writer.writeSigned(v, signedBits(*scale))
+    writer.write(1, 1)
+    writer.write(signedBits(*rotate), 5)
+    for v in rotate: writer.writeSigned(v, signedBits(*rotate))
+    writer.write(signedBits(x, y), 5)
+    writer.writeSigned(x, signedBits(x, y))
+    writer.writeSigned(y, signedBits(x, y))
+    writer.align()
+
+def tag(type, body=b''):
+    if len(body) < 0x3f:
+        return struct.pack('<H', type << 6 | len(body)) + body
+    return struct.pack('<Hi', type << 6 | 0x3f, len(body)) + body
+
+def defineShape(id, size, color, gradient=False):
+    # [DefineShape] a filled size x size square (twips) around the origin
+    half = size // 2
+    writer = BitWriter()
+    rect(writer, -half, half, -half, half)
+    writer.align()
+    if gradient:
+        # one linear gradient fill style, from the color to white
+        writer.data += bytearray(struct.pack('<BB', 1, 0x10))
+        matrix(writer, [size / 32768.0, size / 32768.0], [0, 0], 0, 0)
+        writer.data += bytearray(struct.pack('<BBBBBBBBB', 2, 0, color[0], color[1], color[2], 255, 255, 255, 255))
+        writer.data += bytearray(struct.pack('<B', 0))
+    else:
+        # one solid fill style, no line styles
+        writer.data += bytearray(struct.pack('<BBBBBB', 1, 0x00, color[0], color[1], color[2], 0))
+    writer.write(1, 4)
+    writer.write(0, 4)
+    # style change: fill style 0 and move to the top left corner
+    writer.write(0b000011, 6)
+    writer.write(signedBits(half), 5)
+    writer.writeSigned(-half, signedBits(half))
+    writer.writeSigned(-half, signedBits(half))
+    writer.write(1, 1)
+    # straight edges, general lines
+    for dx, dy in ((size, 0), (0, size), (-size, 0), (0, -size)):
+        bits = max(signedBits(dx, dy), 2)
+        writer.write(0b11, 2)
+        writer.write(bits - 2, 4)
+        writer.write(1, 1)
+        writer.writeSigned(dx, bits)
+        writer.writeSigned(dy, bits)
+    # end of shape
+    writer.write(0, 6)
+    return tag(2, struct.pack('<H', id) + writer.bytes())
+
+def placeObject(depth, id, f):
+    # [PlaceObject2] the character on frame 0, moves afterwards
+    t = f * 0.1 + depth
+    writer = BitWriter()
+    scale = 1 + 0.5 * math.sin(t)
+    angle = t * 0.2
+    matrix(writer, [scale * math.cos(angle), scale * math.cos(angle)], [math.sin(angle), -math.sin(angle)],
+           int(2000 + 1500 * math.cos(t)), int(2000 + 1500 * math.sin(t)))
+    if f == 0:
+        return tag(26, struct.pack('<BHH', 0x06, depth, id) + writer.bytes())
+    return tag(26, struct.pack('<BH', 0x05, depth) + writer.bytes())
+
+def generate(frames, depths, shapes, frameRate=24, gradients=False):
+    tags = []
+    for s in range(shapes):
+        # with gradients, every other shape gets one and there are only two colors
+        color = ((s // 2 % 2) * 200, 90, 150) if gradients else ((s * 40) % 256, (s * 90) % 256, (s * 150) % 256)
+        tags.append(defineShape(s + 1, 400 + 20 * s, color, gradients and s % 2 == 0))
+    for f in range(frames):
+        for d in range(depths):
+            tags.append(placeObject(d + 1, d % shapes + 1, f))
+        tags.append(tag(1))
+    tags.append(tag(0))
+
+    writer = BitWriter()
+    rect(writer, 0, 8000, 0, 8000)
+    body = writer.bytes() + struct.pack('<HH', frameRate << 8, frames) + b''.join(tags)
+    # zlib compressed, pyswf misreads the header of uncompressed files
+    return b'CWS' + struct.pack('<BI', 10, 8 + len(body)) + zlib.compress(body)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Writes a synthetic .swf for benchmarks')
+    parser.add_argument('file')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--depths', type=int, default=10)
+    parser.add_argument('--shapes', type=int, default=10)
+    parser.add_argument('--gradients', action='store_true', help='gradient fills on half the shapes, few distinct styles')
+    args = parser.parse_args(argv)
+    open(args.file, 'wb').write(generate(args.frames, args.depths, args.shapes, gradients=args.gradients))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+
+class ConversionCache(object):
+    """
+    Content-addressed store of conversion outputs (SVG files, .anim curve
+    text), keyed by a hash of the SWF inputs each one was generated from.
+    """
+    # bump when exporter changes make cached outputs stale
+    VERSION = 1
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists('{}/objects'.format(folder)):
+            os.makedirs('{}/objects'.format(folder))
+
+    @staticmethod
+    def key(parts):
+        hash = ConversionCache.hash()
+        for part in parts:
+            ConversionCache.update(hash, part)
+        return hash.hexdigest()
+
+    @staticmethod
+    def hash():
+        # for keys of parts that are streamed, see update
+        return hashlib.sha1(str(ConversionCache.VERSION).encode('ascii'))
+
+    @staticmethod
+    def update(hash, part):
+        if not isinstance(part, (bytes, memoryview, buffer)):
+            part = repr(part).encode('utf-8')
+        hash.update(str(len(part)).encode('ascii') + b':')
+        hash.update(part)
+
+    def path(self, key):
+        return '{}/objects/{}/{}'.format(self.folder, key[:2], key[2:])
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return open(path, 'rb').read()
+
+    def put(self, key, data):
+        path = self.path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # write then rename, so parallel conversions never read half a file
+        temp = '{}.{}.tmp'.format(path, os.getpid())
+        open(temp, 'wb').write(data)
+        os.rename(temp, path)
+
+    def getObject(self, key):
+        data = self.get(key)
+        return pickle.loads(data) if data != None else None
+
+    def putObject(self, key, object):
+        self.put(key, pickle.dumps(object, 2))
+
+class Manifest(object):
+    """
+    Output file -> input hash of a conversion's output sink, so unchanged
+    outputs are left in place and stale ones can be removed. Sinks that
+    can't be read back (archives) start from an empty manifest.
+    """
+    FILE = 'manifest.json'
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.files = {}
+        self.curves = {}
+        data = sink.read(Manifest.FILE)
+        if data != None:
+            try:
+                manifest = json.loads(data)
+                self.files = manifest.get('files', {})
+                self.curves = manifest.get('curves', {})
+            except ValueError as e:
+                logging.warning("<Cache> Ignoring invalid manifest {}/{}: {}".format(sink, Manifest.FILE, e))
+
+    def isCurrent(self, file, key):
+        return self.files.get(file) == key and self.sink.exists(file)
+
+    def save(self, files, curves):
+        # remove outputs of the previous conversion that are gone now
+        for file in self.files:
+            if file not in files and self.sink.exists(file):
+                logging.info("<Cache> Removing stale {}".format(file))
+                self.sink.remove(file)
+        self.files = files
+        self.curves = curves
+        self.sink.write(Manifest.FILE, json.dumps({'files': files, 'curves': curves}, indent=2, sort_keys=True))
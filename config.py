@@ -14,5 +14,12 @@ class FRAMEKEYFRAME:
 # SWF to SVG conversion scale
 unit_divisor=20.0
 
+# Lossy curve reduction: max error allowed when dropping Position/Scale/Euler
+# keyframes that linear interpolation can rebuild (0 disables it)
+curve_tolerance=0.0
+
+# Write the tag/frame/curve inventory to conversion.dump.jsonl
+DUMP_INVENTORY = False
+
 # Log Level
 TERMINAL_LOG_LEVEL = logging.DEBUG
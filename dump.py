@@ -0,0 +1,20 @@
+import json
+
+class InventoryDump(object):
+    """
+    Tag, frame and curve inventory of a conversion as JSON lines, one
+    {"type": ...} record per line. Off unless asked for, nothing is
+    formatted on normal runs.
+    """
+    FILE = 'conversion.dump.jsonl'
+
+    def __init__(self, sink):
+        self.file = sink.open(InventoryDump.FILE)
+
+    def write(self, type, **fields):
+        fields['type'] = type
+        self.file.write(json.dumps(fields, sort_keys=True))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
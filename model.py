@@ -1,4 +1,4 @@
-from numpy import matrix, asscalar, arctan2, pi
+from numpy import array, empty, asscalar, arctan2, sqrt, pi
 from numpy.linalg import norm
 from swf.data import SWFMatrix
 
@@ -15,8 +15,11 @@ from config import unit_divisor
 # 3matrix         matrix
 
 class TMatrix(object):
-    def __init__(self, matrix = [1,0,0,1,0,0]):
-        if (isinstance(matrix,list)):
+    __slots__ = ('matrix',)
+    def __init__(self, matrix = None):
+        if matrix == None:
+            self.matrix = [1,0,0,1,0,0]
+        elif (isinstance(matrix,list)):
             self.matrix = matrix
         elif (isinstance(matrix,SWFMatrix)):
             self.matrix = matrix.to_array()
@@ -35,14 +38,11 @@ class TMatrix(object):
         self.matrix[5] = pos[1]
         return self
     def __mul__(self, other):
-        if not other is TMatrix: other = TMatrix(other)
-        matrix_a = matrix([[self.matrix[0],self.matrix[2],self.matrix[4]],[self.matrix[1],self.matrix[3],self.matrix[5]],[0,0,1]])
-        matrix_b = matrix([[other.matrix[0],other.matrix[2],other.matrix[4]],[other.matrix[1],other.matrix[3],other.matrix[5]],[0,0,1]])
-        mult = (matrix_a * matrix_b).tolist()
-        return TMatrix([mult[0][0],mult[1][0],mult[0][1],mult[1][1],mult[0][2],mult[1][2]])
+        if not isinstance(other, TMatrix): other = TMatrix(other)
+        return TMatrix(compose(self.matrix, other.matrix))
     def __rmul__(self,other):
-        if not other is TMatrix: other = TMatrix(other)
-        return __mul__(other, self)
+        if not isinstance(other, TMatrix): other = TMatrix(other)
+        return other.__mul__(self)
     def getSWFMatrix(self):
         swfMatrix = SWFMatrix(None)
         swfMatrix.scaleX = self.matrix[0]
@@ -53,6 +53,51 @@ class TMatrix(object):
         swfMatrix.translateY = self.matrix[5]
         return swfMatrix
 
+def compose(a, b):
+    # row by column product of the two 3matrix, homogeneous terms included
+    # so the result (down to signed zeros) matches the full 3x3 product
+    return [a[0]*b[0] + a[2]*b[1] + a[4]*0,
+            a[1]*b[0] + a[3]*b[1] + a[5]*0,
+            a[0]*b[2] + a[2]*b[3] + a[4]*0,
+            a[1]*b[2] + a[3]*b[3] + a[5]*0,
+            a[0]*b[4] + a[2]*b[5] + a[4]*1,
+            a[1]*b[4] + a[3]*b[5] + a[5]*1]
+
+##
+#   Transformation Matrix Array
+##
+
+# (N,6) float array, one [a,b,c,d,e,f] row per matrix
+# every operation is applied to all rows at once
+
+class TMatrixArray(object):
+    def __init__(self, matrices = []):
+        if (isinstance(matrices,TMatrixArray)):
+            self.matrices = matrices.matrices
+        else:
+            self.matrices = array(matrices, dtype=float).reshape(-1,6)
+    @staticmethod
+    def fromTransforms(transforms):
+        return TMatrixArray([t.matrix.matrix for t in transforms])
+    def __len__(self):
+        return len(self.matrices)
+    def __getitem__(self, i):
+        return TMatrix(self.matrices[i].tolist())
+    def getPosition(self):
+        return self.matrices[:,4:6]/unit_divisor
+    def getScale(self):
+        m = self.matrices
+        scale = empty((len(m),2))
+        scale[:,0] = sqrt(m[:,0]*m[:,0] + m[:,1]*m[:,1])
+        scale[:,1] = sqrt(m[:,2]*m[:,2] + m[:,3]*m[:,3])
+        return scale
+    def getEuler(self):
+        return arctan2(self.matrices[:,0],self.matrices[:,1])*180/pi-90
+    def __mul__(self, other):
+        if isinstance(other, TMatrix): other = other.matrix
+        if not isinstance(other, TMatrixArray): other = TMatrixArray(other)
+        return TMatrixArray(array(compose(self.matrices.T, other.matrices.T)).T)
+
 ##
 #   Animation Type
 ##
@@ -0,0 +1,87 @@
+import time
+import json
+import marshal
+import logging
+
+class ConversionReport(object):
+    """
+    Stage timers and counters of a conversion, saved as JSON to its sink
+    next to conversion.log. cProfile and tracemalloc can be turned on for a run.
+    """
+    FILE = 'conversion.json'
+    PROFILE = 'conversion.prof'
+    # allocation sites kept from the tracemalloc snapshot
+    TOP = 25
+
+    class Stage(object):
+        def __init__(self, report, name):
+            self.report = report
+            self.name = name
+        def __enter__(self):
+            self.start = time.time()
+            return self
+        def __exit__(self, type, value, traceback):
+            self.report.stages[self.name] = self.report.stages.get(self.name, 0) + time.time() - self.start
+
+    def __init__(self, profile = False, memory = False):
+        # stage -> seconds, nested stages are included in their parent
+        self.stages = {}
+        self.counters = {}
+        self.profile = profile
+        self.memory = memory
+        self.profiler = None
+        self.allocations = []
+
+    def stage(self, name):
+        return ConversionReport.Stage(self, name)
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def start(self):
+        if self.profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if self.memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                logging.warning("<Report> tracemalloc is not available on this python, memory tracing is off")
+                self.memory = False
+            else:
+                tracemalloc.start()
+
+    def stop(self):
+        if self.profiler != None:
+            self.profiler.disable()
+        if self.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            self.set('memory.peak', peak)
+            self.allocations = [str(s) for s in tracemalloc.take_snapshot().statistics('lineno')[:ConversionReport.TOP]]
+            tracemalloc.stop()
+
+    def save(self, sink):
+        report = {'stages': self.stages, 'counters': self.counters}
+        if self.allocations:
+            report['allocations'] = self.allocations
+        sink.write(ConversionReport.FILE, json.dumps(report, indent=2, sort_keys=True))
+        if self.profiler != None:
+            # what Profile.dump_stats writes, for pstats
+            self.profiler.create_stats()
+            sink.write(ConversionReport.PROFILE, marshal.dumps(self.profiler.stats))
+
+def timed(stage):
+    # times a method of an object that has a report
+    def decorator(method):
+        def timedMethod(self, *args, **kwargs):
+            with self.report.stage(stage):
+                return method(self, *args, **kwargs)
+        timedMethod.__name__ = method.__name__
+        timedMethod.__doc__ = method.__doc__
+        return timedMethod
+    return decorator
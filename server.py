@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+import traceback
+from multiprocessing import Pool, cpu_count
+from SocketServer import ThreadingMixIn, UnixStreamServer
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from config import ANIM_TEMPLATE, TERMINAL_LOG_LEVEL
+from anim import AnimDocument
+from sink import DictSink, ZipSink
+from swf2unity import OPTIONS, rootFolder, convert, convertTo
+
+# localhost only, jobs name files on this machine
+HOST = '127.0.0.1'
+PORT = 8642
+# JSON paths are unicode, they're encoded like the command line's
+ENCODING = sys.getfilesystemencoding() or 'utf-8'
+
+##
+#   Jobs
+
+class ConversionDaemon(object):
+    """
+    Bounded pool of conversion processes, forked once with pyswf, lxml,
+    numpy, yaml and the .anim template already loaded, so a job only pays
+    for its own conversion. Jobs wait for a free process in the handler
+    thread that received them.
+    """
+    def __init__(self, jobs = cpu_count(), defaults = {}):
+        self.defaults = dict(OPTIONS, **defaults)
+        self.jobs = jobs
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = set()
+        self.converted = 0
+        self.failed = 0
+        self.time = 0
+        # warm up before forking, every worker inherits the parsed template
+        AnimDocument.Template.load('{}/{}'.format(rootFolder, ANIM_TEMPLATE))
+        self.pool = Pool(jobs, _initWorker)
+
+    def getOptions(self, job):
+        unknown = [key for key in job if key not in OPTIONS]
+        if unknown:
+            raise ValueError('unknown options: {}'.format(', '.join(sorted(unknown))))
+        options = dict(self.defaults, **job)
+        # pool workers can't start pools of their own
+        options['svgJobs'] = 1
+        return options
+
+    def convert(self, file, output, options):
+        """
+        Converts file to the output folder (or archive), or to memory when
+        output is None: the result then holds the files. Blocks until done.
+        """
+        with self.lock:
+            if output in self.running:
+                raise ValueError('"{}" is already being converted'.format(output))
+            if output != None:
+                self.running.add(output)
+            self.pending += 1
+        try:
+            result = self.pool.apply(_convert, ((file, output, options, time.time()),))
+        finally:
+            with self.lock:
+                self.running.discard(output)
+                self.pending -= 1
+        with self.lock:
+            self.converted += 1
+            self.failed += 0 if result['ok'] else 1
+            self.time += result['time']
+        logging.info('<Server> {} -> {} in {:.2f}s (waited {:.2f}s){}'.format(
+            file, result['output'], result['time'], result['wait'], '' if result['ok'] else ' failed: {}'.format(result['error'])))
+        return result
+
+    def status(self):
+        with self.lock:
+            return {'workers': self.jobs, 'pending': self.pending, 'converted': self.converted, 'failed': self.failed,
+                    'time': self.time, 'uptime': time.time() - self.started}
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+def _initWorker():
+    # ctrl-c is for the server, it terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _convert(job):
+    file, output, options, queued = job
+    wait = time.time() - queued
+    if output != None:
+        result = convert((file, output, options))
+    else:
+        sink = DictSink()
+        result = convertTo(file, sink, options)
+        result['files'] = sink.files
+    result['wait'] = wait
+    return result
+
+##
+#   HTTP
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """
+    GET  /status   the daemon's counters
+    POST /convert  {"file": ..., "output": ..., <swf2unity options>}
+                   with an output, the outputs go there and the job's result
+                   and stage timings are sent back as JSON; without one, the
+                   outputs are sent back as a zip, the result in X-Conversion
+    """
+    server_version = 'swf2unity'
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self.sendJSON(404, {'error': 'no such path {}'.format(self.path)})
+        self.sendJSON(200, self.server.daemon.status())
+
+    def do_POST(self):
+        if self.path != '/convert':
+            return self.sendJSON(404, {'error': 'no such path {}'.format(self.path)})
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            if not isinstance(job, dict) or not isinstance(job.get('file'), basestring) or \
+               not isinstance(job.get('output', ''), basestring):
+                raise ValueError('a job is a {"file": ..., "output": ...} object')
+            file = os.path.abspath(job.pop('file').encode(ENCODING))
+            output = job.pop('output', None)
+            output = os.path.abspath(output.encode(ENCODING)) if output != None else None
+            if not os.path.isfile(file):
+                raise ValueError('no such file {}'.format(file))
+            result = self.server.daemon.convert(file, output, self.server.daemon.getOptions(job))
+        except ValueError as e:
+            return self.sendJSON(400, {'error': str(e)})
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            return self.sendJSON(500, {'ok': False, 'error': '{}: {}'.format(e.__class__.__name__, e)})
+
+        files = result.pop('files', None)
+        if files == None or not result['ok']:
+            return self.sendJSON(200 if result['ok'] else 500, result)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('X-Conversion', json.dumps(result, sort_keys=True))
+        self.end_headers()
+        zip = ZipSink(self.wfile)
+        for file in sorted(files):
+            zip.commit(file, files[file])
+        zip.close()
+
+    def sendJSON(self, code, data):
+        body = json.dumps(data, indent=2, sort_keys=True)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def log_message(self, format, *args):
+        logging.debug('<Server> {} {}'.format(self.address_string(), format % args))
+
+class TCPConversionServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class UnixConversionServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # a socket left by a server that didn't shut down
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        UnixStreamServer.server_bind(self)
+
+    def server_close(self):
+        UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+##
+#   MAIN
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='server', description='Converts .swf files sent to a local HTTP port or unix socket, with imports and the .anim template kept loaded')
+    address = parser.add_mutually_exclusive_group()
+    address.add_argument('--port', type=int, default=PORT, help='HTTP port on {} (default: %(default)s)'.format(HOST))
+    address.add_argument('--socket', metavar='PATH', help='listen on a unix socket instead')
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(), help='parallel conversions (default: cpu count)')
+    parser.add_argument('--cache', metavar='FOLDER', help='cache folder of the jobs that don\'t set one')
+    args = parser.parse_args(argv)
+
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    logstream = logging.StreamHandler()
+    logstream.setLevel(TERMINAL_LOG_LEVEL)
+    logstream.setFormatter(logging.Formatter('%(levelname)s\t%(message)s'))
+    logger.addHandler(logstream)
+
+    daemon = ConversionDaemon(args.jobs, {'cache': os.path.abspath(args.cache) if args.cache else None})
+    if args.socket:
+        server = UnixConversionServer(args.socket, ConversionHandler)
+    else:
+        server = TCPConversionServer((HOST, args.port), ConversionHandler)
+    server.daemon = daemon
+    # stop like on ctrl-c, so the socket and the pool are cleaned up
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info('<Server> Listening on {} with {} worker(s)'.format(args.socket or 'http://{}:{}'.format(HOST, args.port), args.jobs))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info('<Server> Shutting down')
+        server.server_close()
+        daemon.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import os
+import time
+import shutil
+import tarfile
+import zipfile
+from io import BytesIO
+
+class OutputSink(object):
+    """
+    Where a conversion writes its files: SVGDocument, AnimDocument, the
+    manifest, report and dump all go through open/write instead of paths,
+    so a conversion can end up in a folder, in memory or in an archive.
+    Files are handed over as each one is generated.
+    """
+    def __init__(self, name):
+        self.name = name
+        # bytes of every file written through this sink
+        self.sizes = {}
+
+    def __str__(self):
+        return self.name
+
+    def open(self, file):
+        # binary file-like buffered in memory, on close it's handed to the
+        # sink's commit(file, data); sinks that write directly override open
+        return OutputSink.Entry(self, file)
+
+    def write(self, file, data):
+        entry = self.open(file)
+        entry.write(data)
+        entry.close()
+
+    def read(self, file):
+        # contents of a file already in the sink, None if it can't be read back
+        return None
+
+    def exists(self, file):
+        return False
+
+    def remove(self, file):
+        pass
+
+    def size(self, file):
+        return self.sizes.get(file, 0)
+
+    def close(self):
+        pass
+
+    class Entry(BytesIO):
+        def __init__(self, sink, file):
+            BytesIO.__init__(self)
+            self.sink = sink
+            self.file = file
+
+        def write(self, data):
+            # log records may be unicode
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            return BytesIO.write(self, data)
+
+        def close(self):
+            if not self.closed:
+                self.sink.sizes[self.file] = self.tell()
+                self.sink.commit(self.file, self.getvalue())
+            BytesIO.close(self)
+
+##
+#   Sinks
+
+class DirectorySink(OutputSink):
+    """
+    Files in a folder, the default. With clean, a previous folder is removed
+    first, otherwise it's updated in place (see Manifest).
+    """
+    def __init__(self, folder, clean = True):
+        super(DirectorySink, self).__init__(folder)
+        self.folder = folder
+        if clean and os.path.exists(folder):
+            shutil.rmtree(folder)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def path(self, file):
+        return '{}/{}'.format(self.folder, file)
+
+    def open(self, file):
+        # straight to disk, nothing is buffered
+        return open(self.path(file), 'wb')
+
+    def read(self, file):
+        return open(self.path(file), 'rb').read() if self.exists(file) else None
+
+    def exists(self, file):
+        return os.path.exists(self.path(file))
+
+    def remove(self, file):
+        if self.exists(file):
+            os.remove(self.path(file))
+
+    def size(self, file):
+        return os.path.getsize(self.path(file)) if self.exists(file) else 0
+
+class DictSink(OutputSink):
+    """
+    Files as {name: bytes}, nothing touches the disk.
+    """
+    def __init__(self, name = '<memory>'):
+        super(DictSink, self).__init__(name)
+        self.files = {}
+
+    def commit(self, file, data):
+        self.files[file] = data
+
+    def read(self, file):
+        return self.files.get(file)
+
+    def exists(self, file):
+        return file in self.files
+
+    def remove(self, file):
+        self.files.pop(file, None)
+        self.sizes.pop(file, None)
+
+class ZipSink(OutputSink):
+    """
+    Files streamed to a .zip, to a path or to a file-like that may not seek
+    (a socket): every file is written to it as soon as it's closed.
+    """
+    def __init__(self, target, compression = zipfile.ZIP_DEFLATED):
+        super(ZipSink, self).__init__(target if isinstance(target, basestring) else '<zip>')
+        self.stream = open(target, 'wb') if isinstance(target, basestring) else None
+        self.zip = zipfile.ZipFile(ZipSink.Stream(self.stream or target), 'w', compression)
+
+    def commit(self, file, data):
+        info = zipfile.ZipInfo(file, time.localtime()[:6])
+        info.compress_type = self.zip.compression
+        info.external_attr = 0644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self):
+        self.zip.close()
+        if self.stream:
+            self.stream.close()
+
+    class Stream(object):
+        # zipfile only needs tell() to write, counting the bytes is enough
+        def __init__(self, stream):
+            self.stream = stream
+            self.position = 0
+
+        def write(self, data):
+            self.stream.write(data)
+            self.position += len(data)
+
+        def tell(self):
+            return self.position
+
+        def flush(self):
+            self.stream.flush()
+
+class TarSink(OutputSink):
+    """
+    Files streamed to a .tar (or .tar.gz with compression='gz'), to a path
+    or to a file-like, in tarfile's stream mode.
+    """
+    def __init__(self, target, compression = ''):
+        super(TarSink, self).__init__(target if isinstance(target, basestring) else '<tar>')
+        mode = 'w|{}'.format(compression)
+        if isinstance(target, basestring):
+            self.tar = tarfile.open(target, mode)
+        else:
+            self.tar = tarfile.open(fileobj=target, mode=mode)
+
+    def commit(self, file, data):
+        info = tarfile.TarInfo(file)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0644
+        self.tar.addfile(info, BytesIO(data))
+
+    def close(self):
+        self.tar.close()
@@ -1,72 +1,158 @@
+import re
+import json
+import hashlib
 import logging
+from copy import copy
+from multiprocessing import Pool
 from swf.export import SVGExporter
 from swf.tag import TagShowFrame, TagPlaceObject, TagRemoveObject, TagDefineShape, TagDefineMorphShape, TagDefineSprite
-from swf.export import XLINK_HREF
+from swf.export import XLINK_HREF, SVG_NS
+from swf.data import SWFMatrix, SWFShape, SWFShapeRecordStyleChange
 from lxml import etree
 
 from model import TMatrix
 from config import unit_divisor
 from swf_doc import SWFDocument
+from cache import ConversionCache
+from report import timed
 
 class ComposedSVGExporter(SVGExporter):
     """
     An SVG exporter which knows how to export a single shape.
     """
+    class Tags(object):
+        # the tags of a single export, in place of the whole SWF
+        def __init__(self, tags):
+            self.tags = tags
+        def all_tags_of_type(self, type):
+            return [tag for tag in self.tags if isinstance(tag, type)]
+
     def __init__(self, document, margin=0):
         self.document = document
         self.frame = None
         self.shape_tags = []
         self.display_tags = []
+        self.display_index = None
+        # path data bytes saved by the compaction of the last export
+        self.saved = 0
+        # atlas exports: every frame is centered on the origin
+        self.centered = False
         super(ComposedSVGExporter, self).__init__(margin = margin)
 
+    def export(self, swf, force_stroke=False):
+        # every file gets its own gradient ids/defs, the shape exporter
+        # would otherwise reference gradients defined in a previous file
+        self.shape_exporter.num_gradients = 0
+        self.shape_exporter._gradients = {}
+        self.shape_exporter._gradient_ids = {}
+        self.saved = 0
+        return super(ComposedSVGExporter, self).export(swf, force_stroke)
+
     def export_all(self, swf):
         self.shape_tags = [tag for tag in swf.tags if isinstance(tag,TagDefineShape) or isinstance(tag,TagDefineMorphShape)]
-        return super(ComposedSVGExporter, self).export(swf)
+        return self.export(swf)
 
-    def getDisplayTagById(self, tags, id):
+    def indexDisplayTags(self, tags):
+        # characterId -> first [PlaceObject] on the root timeline,
+        # falling back to the ones nested in [DefineSprite] tag lists
+        index = {}
+        sprites = []
         for tag in tags:
             if (isinstance(tag,TagPlaceObject)):
-                if tag.characterId == id:
-                    return tag
-        return None
+                index.setdefault(tag.characterId, tag)
+            elif (isinstance(tag,TagDefineSprite)):
+                sprites.append(tag)
+        for sprite in sprites:
+            for tag in sprite.tags:
+                if (isinstance(tag,TagPlaceObject)):
+                    index.setdefault(tag.characterId, tag)
+        self.display_index = (tags, index)
+        return index
+
+    @staticmethod
+    def getTimelineTags(swf):
+        # where display tags are looked up: lazily parsed SWFs keep their
+        # shapes undecoded in headerTags, reading tags would decode them all
+        return swf.swf.headerTags if swf.lazy else swf.swf.tags
+
+    def getDisplayTagById(self, tags, id):
+        if self.display_index == None or self.display_index[0] is not tags:
+            self.indexDisplayTags(tags)
+        return self.display_index[1].get(id, None)
 
     def export_layer(self, layer, swf):
         self.shape_tags = []
         self.display_tags = []
         for f, frame in enumerate(layer.frames):
             char = swf.getCharacterById(frame.id)
-            display_tag = self.getDisplayTagById(swf.swf.tags, char.id)
+            # work on copies, the tags are shared by every export
+            display_tag = copy(self.getDisplayTagById(self.getTimelineTags(swf), char.id))
             if (isinstance(char, SWFDocument.Sprite)):
                 char = char.shape
                 display_tag.shape_id = char.id
-            shape_tag = char.tag
+            shape_tag = copy(char.tag)
             if len(layer.frames) > 1:
                 shape_tag.f = f
                 display_tag.f = f
             if frame.f == 0:
-                bounds = shape_tag.shape_bounds
-                layer.center = [bounds.xmin + (bounds.xmax-bounds.xmin)/2, bounds.ymin + (bounds.ymax - bounds.ymin)/2]
+                layer.center = boundsCenter(shape_tag.shape_bounds)
                 display_tag.matrix = TMatrix().getSWFMatrix()
             else:
-                bounds = shape_tag.shape_bounds
-                fpos = [bounds.xmin + (bounds.xmax-bounds.xmin)/2, bounds.ymin + (bounds.ymax - bounds.ymin)/2]
+                fpos = boundsCenter(shape_tag.shape_bounds)
                 display_tag.matrix = TMatrix().setPosition([
                                 layer.center[0] - fpos[0],
                                 layer.center[1] - fpos[1]]
                              ).getSWFMatrix()
             self.shape_tags.append(shape_tag)
             self.display_tags.append(display_tag)
-        return super(ComposedSVGExporter, self).export(swf.swf)
+        return self.export(swf.swf)
+
+    def export_atlas(self, chars, swf):
+        # one file for every frame of every layer: group f:N holds the N-th
+        # character centered on the origin, only these shapes go to the defs
+        shape_tags = []
+        self.display_tags = []
+        for n, char in enumerate(chars):
+            display_tag = copy(self.getDisplayTagById(self.getTimelineTags(swf), char.id))
+            if (isinstance(char, SWFDocument.Sprite)):
+                char = char.shape
+            shape_tag = copy(char.tag)
+            shape_tag.f = n
+            display_tag.f = n
+            center = boundsCenter(shape_tag.shape_bounds)
+            display_tag.hasMatrix = True
+            display_tag.matrix = TMatrix().setPosition([-center[0], -center[1]]).getSWFMatrix()
+            shape_tags.append(shape_tag)
+            self.display_tags.append(display_tag)
+        self.centered = True
+        try:
+            return self.export(ComposedSVGExporter.Tags(shape_tags))
+        finally:
+            self.centered = False
+
+    def _serialize(self):
+        if self.centered:
+            # symmetric viewBox, so the asset's center pivot is every frame's center
+            width = max(abs(self.bounds.minx), abs(self.bounds.minx + self.bounds.width))
+            height = max(abs(self.bounds.miny), abs(self.bounds.miny + self.bounds.height))
+            self.svg.set("width", "%dpx" % round(2*width))
+            self.svg.set("height", "%dpx" % round(2*height))
+            self.svg.set("viewBox", "%s" % " ".join(map(str, [-width, -height, 2*width, 2*height])))
+        if self.document.compaction != None:
+            self.saved += self.document.compaction.apply(self.svg)
+        if self.document.styles:
+            internStyles(self.svg)
+        return super(ComposedSVGExporter, self)._serialize()
 
     def export_frame(self, frame, swf):
         self.shape_tags = [swf.getCharacterById(frame.id).tag]
-        self.display_tags = [self.getDisplayTagById(swf.swf.tags, frame.id)]
-        return super(ComposedSVGExporter, self).export(swf.swf)
+        self.display_tags = [self.getDisplayTagById(self.getTimelineTags(swf), frame.id)]
+        return self.export(swf.swf)
 
     def export_shape(self, shape, swf):
         self.shape_tags = [swf.getCharacterById(shape.id).tag]
-        self.display_tags = [self.getDisplayTagById(swf.swf.tags, shape.id)]
-        return super(ComposedSVGExporter, self).export(swf.swf)
+        self.display_tags = [self.getDisplayTagById(self.getTimelineTags(swf), shape.id)]
+        return self.export(swf.swf)
 
     def get_shape_tags(self, tags):
         return super(ComposedSVGExporter, self).get_shape_tags(self.shape_tags)
@@ -94,12 +180,275 @@ class ComposedSVGExporter(SVGExporter):
         return use
 
 
+##
+#   Shape canonicalization (deduplication)
+
+# definition fields that don't change how a shape looks
+CANONICAL_SKIP = ('_characterId', 'characterId', '_shape_bounds', 'shape_bounds', '_edge_bounds', 'record_id')
+# parsed fields of a shape, the others are export caches
+CANONICAL_SHAPE = ('_initialFillStyles', '_initialLineStyles', '_records')
+
+def canonicalShape(tag):
+    """
+    Hashable form of a shape definition without its id and bounds, with
+    coordinates relative to its first moveTo so translated copies match.
+    """
+    return _canonical(tag, shapeOrigin(tag))
+
+def shapeOrigin(tag):
+    # first moveTo of a shape definition
+    if hasattr(tag, 'shapes'):
+        for record in tag.shapes.records:
+            if isinstance(record, SWFShapeRecordStyleChange) and record.state_moveto:
+                return (record.move_deltaX, record.move_deltaY)
+    return (0, 0)
+
+def boundsCenter(bounds):
+    return [bounds.xmin + (bounds.xmax-bounds.xmin)/2, bounds.ymin + (bounds.ymax-bounds.ymin)/2]
+
+def _canonical(value, origin):
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v, origin) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, _canonical(v, origin)) for k, v in value.items()))
+    elif isinstance(value, SWFMatrix):
+        return (value.scaleX, value.rotateSkew0, value.rotateSkew1, value.scaleY,
+                value.translateX - origin[0], value.translateY - origin[1])
+    elif hasattr(value, '__dict__'):
+        fields = dict(vars(value))
+        if isinstance(value, SWFShape):
+            names = CANONICAL_SHAPE
+        else:
+            names = sorted(k for k in fields if k not in CANONICAL_SKIP)
+        if isinstance(value, SWFShapeRecordStyleChange) and value.state_moveto:
+            fields['move_deltaX'] -= origin[0]
+            fields['move_deltaY'] -= origin[1]
+        return (value.__class__.__name__, tuple((k, _canonical(fields.get(k), origin)) for k in names))
+    return value
+
+##
+#   Style interning
+
+# presentation attributes pyswf writes on every path
+STYLE_ATTRIBUTES = ('fill', 'fill-opacity', 'stroke', 'stroke-width', 'stroke-opacity', 'stroke-linejoin', 'stroke-linecap')
+# <style type="text/css"><![CDATA[]]></style>
+STYLE_OVERHEAD = 46
+
+def styleName(prefix, text):
+    # named after the content, the same style gets the same name in every
+    # file of a conversion, whichever process exports it
+    return prefix + hashlib.sha1(text).hexdigest()[:6]
+
+def gradientKey(gradient, skip = ('id',)):
+    # tag, attributes and stops, independent of where the element is
+    attributes = lambda element: sorted((k, v) for k, v in element.attrib.items() if k not in skip)
+    return repr((gradient.tag, attributes(gradient), [attributes(stop) for stop in gradient.getchildren()]))
+
+def internStyles(svg):
+    """
+    Writes the styles of an exported svg once: gradients are named after
+    their content, the stops of gradients that only differ by transform
+    go to a template they link to, and fill/stroke attributes repeated
+    enough to pay for it become classes of a <style> element.
+    Returns the number of classes.
+    """
+    urls = {}
+    gradients = {}
+    templates = {}
+    for gradient in list(svg.iter('{%s}linearGradient' % SVG_NS, '{%s}radialGradient' % SVG_NS)):
+        if gradient.get(XLINK_HREF) != None: continue
+        id = gradient.get('id')
+        name = styleName('g', gradientKey(gradient))
+        urls['url(#%s)' % id] = 'url(#%s)' % name
+        if name in gradients:
+            gradient.getparent().remove(gradient)
+            continue
+        gradient.set('id', name)
+        gradients[name] = gradient
+        templates.setdefault(gradientKey(gradient, ('id', 'gradientTransform')), []).append(gradient)
+    for shared in templates.values():
+        if len(shared) < 2: continue
+        template = copy(shared[0])
+        template.attrib.pop('gradientTransform', None)
+        template.set('id', styleName('g', gradientKey(template)))
+        shared[0].addprevious(template)
+        for gradient in shared:
+            for child in gradient.getchildren():
+                gradient.remove(child)
+            for name in list(gradient.attrib):
+                if name not in ('id', 'gradientTransform'):
+                    del gradient.attrib[name]
+            gradient.set(XLINK_HREF, '#%s' % template.get('id'))
+
+    paths = {}
+    for path in svg.iter('{%s}path' % SVG_NS):
+        style = [(name, urls.get(path.get(name), path.get(name))) for name in STYLE_ATTRIBUTES if name in path.attrib]
+        for name, value in style:
+            path.set(name, value)
+        if style:
+            paths.setdefault(tuple(style), []).append(path)
+    # ' class="name"' on every path and '.name{text}' once, instead of the attributes
+    rules = {}
+    saved = 0
+    for style, shared in paths.items():
+        text = ';'.join('%s:%s' % s for s in style)
+        name = styleName('s', text)
+        inline = sum(len(' %s="%s"' % s) for s in style)
+        saving = len(shared) * (inline - len(name) - 9) - len(name) - len(text) - 3
+        if saving > 0:
+            rules[name] = (text, style, shared)
+            saved += saving
+    if saved <= STYLE_OVERHEAD:
+        return 0
+    for name, (text, style, shared) in rules.items():
+        for path in shared:
+            for attribute, value in style:
+                del path.attrib[attribute]
+            path.set('class', name)
+    element = etree.Element('{%s}style' % SVG_NS, type='text/css')
+    element.text = etree.CDATA(''.join('.%s{%s}' % (name, rules[name][0]) for name in sorted(rules)))
+    svg.insert(0, element)
+    return len(rules)
+
+##
+#   Path compaction
+
+class PathCompaction(object):
+    """
+    Rewrites the path data pyswf writes (absolute M/L/Q, every number with
+    its decimals and a space) to a given precision, with relative commands,
+    without zero-length edges and with collinear lines merged. Coordinates
+    are handled as integers of 10^-precision units, so nothing drifts.
+    """
+    COMMAND = re.compile(r'[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+    # SWF coordinates are twips, 1/20 px: 2 decimals lose nothing
+    PRECISION = 2
+
+    def __init__(self, precision = PRECISION, relative = True, collinear = True, zeroLength = True):
+        self.precision = precision
+        self.relative = relative
+        self.collinear = collinear
+        self.zeroLength = zeroLength
+        self.scale = 10 ** precision
+
+    def key(self):
+        return ['compaction', self.precision, self.relative, self.collinear, self.zeroLength]
+
+    def apply(self, svg):
+        # compacts every path of an svg tree, returns the bytes saved
+        saved = 0
+        for path in svg.iter('{%s}path' % SVG_NS):
+            d = path.get('d')
+            if d == None: continue
+            compact = self.compact(d)
+            if compact != None and len(compact) < len(d):
+                path.set('d', compact)
+                saved += len(d) - len(compact)
+        return saved
+
+    def parse(self, d):
+        # [[start, [(command, points)]]] in integer units, None for commands pyswf doesn't write
+        subpaths = []
+        command = None
+        current = (0, 0)
+        tokens = PathCompaction.COMMAND.findall(d)
+        t = 0
+        while t < len(tokens):
+            if tokens[t].isalpha():
+                command = tokens[t]
+                t += 1
+                continue
+            if command == None or command not in 'MmLlQq':
+                return None
+            count = 4 if command in 'Qq' else 2
+            values = [int(round(float(v) * self.scale)) for v in tokens[t:t+count]]
+            if len(values) < count:
+                return None
+            t += count
+            points = [(values[i], values[i+1]) for i in range(0, count, 2)]
+            if command.islower():
+                points = [(current[0] + x, current[1] + y) for x, y in points]
+            if command in 'Mm':
+                subpaths.append([points[0], []])
+                # coordinates after a moveto are lines
+                command = 'L' if command == 'M' else 'l'
+            elif not subpaths:
+                return None
+            else:
+                subpaths[-1][1].append(('Q' if command in 'Qq' else 'L', points))
+            current = points[-1]
+        return subpaths
+
+    def optimize(self, start, segments):
+        result = []
+        current = start
+        previous = None
+        for command, points in segments:
+            end = points[-1]
+            if self.zeroLength and end == current and all(p == current for p in points):
+                continue
+            if self.collinear and command == 'L' and result and result[-1][0] == 'L':
+                a, b = previous, current
+                if (b[0]-a[0])*(end[1]-b[1]) == (b[1]-a[1])*(end[0]-b[0]) and \
+                   (b[0]-a[0])*(end[0]-b[0]) + (b[1]-a[1])*(end[1]-b[1]) > 0:
+                    result[-1] = ('L', [end])
+                    current = end
+                    continue
+            result.append((command, points))
+            previous, current = current, end
+        return result
+
+    def number(self, value):
+        # shortest text of an integer of 10^-precision units
+        sign = '-' if value < 0 else ''
+        text = str(abs(value))
+        if self.precision == 0:
+            return sign + text
+        text = text.rjust(self.precision + 1, '0')
+        integer, fraction = text[:-self.precision], text[-self.precision:].rstrip('0')
+        if not fraction:
+            return sign + integer
+        return sign + (integer if integer != '0' else '') + '.' + fraction
+
+    def compact(self, d):
+        subpaths = self.parse(d)
+        if subpaths == None:
+            return None
+        output = []
+        last = [None, '']
+        def write(command, points, origin):
+            if command != last[0]:
+                output.append(command)
+                last[1] = ''
+            last[0] = command
+            for x, y in points:
+                for value in (x - origin[0], y - origin[1]):
+                    text = self.number(value)
+                    # separators only where the numbers would run together
+                    if last[1] and not (text[0] == '-' or (text[0] == '.' and '.' in last[1])):
+                        output.append(' ')
+                    output.append(text)
+                    last[1] = text
+        current = (0, 0)
+        for s, (start, segments) in enumerate(subpaths):
+            relative = self.relative and s > 0
+            write('m' if relative else 'M', [start], current if relative else (0, 0))
+            current = start
+            for command, points in self.optimize(start, segments):
+                if self.relative:
+                    write(command.lower(), points, current)
+                else:
+                    write(command, points, (0, 0))
+                current = points[-1]
+        return ''.join(output)
+
 class SVGDocument(object):
 
     class Type:
         SHAPE = 0
         DEPTH = 1
         DEPTH_MULTI = 2
+        ATLAS = 3
         ALL = 99
 
     class Frame(object):
@@ -124,12 +473,27 @@ class SVGDocument(object):
                     if frame.id == id:
                         return [layer, frame]
 
-    def __init__(self, swfDocument, type = Type.DEPTH_MULTI):
+    def __init__(self, swfDocument, type = Type.DEPTH_MULTI, deduplicate = False, styles = False, compaction = None):
         self.exporter = ComposedSVGExporter(self)
         self.swf = swfDocument
+        self.report = swfDocument.report
         self.type = type
+        self.deduplicate = deduplicate
+        # fills, strokes and gradients interned as classes, see internStyles
+        self.styles = styles
+        # PathCompaction applied to every path, None keeps pyswf's path data
+        self.compaction = compaction
+        # char id -> canonical shape hash
+        self.shapeKeys = {}
+        # layer name -> exported file of each frame
+        self.assets = {}
+        # layer name -> group number (f:N) of each frame in the atlas
+        self.atlas = {}
+        # hash of every definition tag, see getExportKey
+        self.definitionsKey = None
         self.parse()
 
+    @timed('svg.parse')
     def parse(self):
         self.layers = []
         logging.info("<SVG> Parsing SWFDocument")
@@ -141,40 +505,254 @@ class SVGDocument(object):
                     layer.addFrame(char.id)
                 self.layers.append(layer)
 
-            logging.debug("<SVG> Layers:")
-            for l, layer in enumerate(self.layers):
-                logging.debug("\t[layer{}] name: {}".format(l, layer))
-                for f, frame in enumerate(layer.frames):
-                    logging.debug("\t\t[frame{}] : id {}".format(f, frame.id))
+        if self.deduplicate:
+            for char in self.swf.shapes + self.swf.sprites:
+                self.getShapeKey(char)
+            logging.info("<SVG> {} characters, {} distinct shapes".format(len(self.shapeKeys), len(set(self.shapeKeys.values()))))
+
+    def getShapeKey(self, char):
+        if char.id not in self.shapeKeys:
+            if isinstance(char, SWFDocument.Sprite):
+                parts = ['sprite', char.matrix, self.getShapeKey(char.shape)]
+            else:
+                parts = [canonicalShape(char.tag)]
+            self.shapeKeys[char.id] = ConversionCache.key(parts)
+        return self.shapeKeys[char.id]
 
-    def export(self, folder, all = False):
+    def getPlacedKey(self, char, matrix):
+        # a shape as an export draws it, with the [a, b, c, d, tx, ty] matrix
+        # the exporter places it with: its canonical form leaves out where the
+        # shape starts, the matrix applied to that start puts it back, so only
+        # copies drawn the same way and in the same place match
+        x, y = shapeOrigin((char.shape if isinstance(char, SWFDocument.Sprite) else char).tag)
+        if isinstance(char, SWFDocument.Sprite) and char.matrix != None:
+            a, b, c, d, tx, ty = char.matrix
+            x, y = a*x + c*y + tx, b*x + d*y + ty
+        a, b, c, d, tx, ty = matrix if matrix != None else [1, 0, 0, 1, 0, 0]
+        return (self.getShapeKey(char), a, b, c, d, a*x + c*y + tx, b*x + d*y + ty)
+
+    def getTaskKey(self, method, target):
+        # placed shapes of an export task, the same for tasks with the same output
+        if method == 'export_frame':
+            # the matrix of the character's first [PlaceObject]
+            tag = self.exporter.getDisplayTagById(ComposedSVGExporter.getTimelineTags(self.swf), target.id)
+            matrix = tag.matrix.to_array() if tag != None and tag.hasMatrix else None
+            return (method, self.getPlacedKey(self.swf.getCharacterById(target.id), matrix))
+        elif method == 'export_layer':
+            # every frame moved so its center is on the first one's, see export_layer
+            keys = []
+            for frame in target.frames:
+                char = self.swf.getCharacterById(frame.id)
+                char = char.shape if isinstance(char, SWFDocument.Sprite) else char
+                center = boundsCenter(char.tag.shape_bounds)
+                if frame.f == 0:
+                    first = center
+                keys.append(self.getPlacedKey(char, [1, 0, 0, 1, first[0] - center[0], first[1] - center[1]]))
+            return (method, tuple(keys))
+        return (method, tuple(self.getShapeKey(char) for char in SVGDocument.getFrames(target)))
+
+    def getAtlas(self):
+        # characters of the atlas groups, frames with the same character
+        # (or an equal shape when deduplicating) share their group
+        groups = {}
+        chars = []
+        self.atlas = {}
+        for layer in self.layers:
+            for frame in layer.frames:
+                char = self.swf.getCharacterById(frame.id)
+                if self.deduplicate:
+                    # the group is the shape centered on the origin
+                    shape = char.shape if isinstance(char, SWFDocument.Sprite) else char
+                    center = boundsCenter(shape.tag.shape_bounds)
+                    key = self.getPlacedKey(shape, [1, 0, 0, 1, -center[0], -center[1]])
+                else:
+                    key = char.id
+                if key not in groups:
+                    groups[key] = len(chars)
+                    chars.append(char)
+                self.atlas.setdefault(str(layer), []).append(groups[key])
+        return chars
+
+    @staticmethod
+    def getFrames(target):
+        # frames (or characters) an export task is made of
+        if isinstance(target, SVGDocument.Layer):
+            return target.frames
+        elif isinstance(target, list):
+            return target
+        return [target]
+
+    @timed('svg.export')
+    def export(self, sink, all = False, jobs = 1, cache = None, manifest = None):
         # Parse
         logging.info("<SVG> Exporting SVGDocument")
+        tasks = self.getExportTasks(sink)
+
+        # Reuse unchanged files (manifest) and cached ones, keyed by their SWF inputs
+        files = {}
+        pending = []
+        for task in tasks:
+            key = self.getExportKey(task) if cache != None else None
+            files[task[0]] = key
+            if key == None:
+                pending.append(task)
+            elif manifest != None and manifest.isCurrent(task[0], key):
+                logging.info("<SVG> %s is up to date", task[0])
+                self.report.count('svg.current')
+            else:
+                svg = cache.get(key)
+                if svg == None:
+                    pending.append(task)
+                else:
+                    logging.info("<SVG> Reusing %s from cache", task[0])
+                    sink.write(task[0], svg)
+                    self.report.count('svg.reused')
+
+        # Export, optionally on a pool of processes, each one with its own exporter;
+        # files are written to the sink as they come
+        pool = None
+        if jobs > 1 and len(pending) > 1:
+            logging.info("<SVG> Exporting {} files with {} processes".format(len(pending), jobs))
+            _export.update(document=self, tasks=dict((task[0], task) for task in pending))
+            pool = Pool(min(jobs, len(pending)), _initExportWorker, (self.swf.file, self.swf.depthNames, self.swf.lazy,
+                        self.type, self.deduplicate, self.styles, self.compaction))
+            results = pool.imap(_exportTask, [task[0] for task in pending])
+        else:
+            results = (self.exportTask(self.exporter, task) for task in pending)
+        saved = {}
+        try:
+            for file, svg, compacted in results:
+                sink.write(file, svg)
+                saved[file] = compacted
+                if cache != None:
+                    cache.put(files[file], svg)
+        finally:
+            if pool != None:
+                pool.close()
+                pool.join()
+                _export.clear()
+
+        if self.compaction != None:
+            for file in sorted(saved):
+                logging.info("<SVG> Compacted %s paths: %s bytes saved", file, saved[file])
+            self.report.set('svg.saved', saved)
+            self.report.count('svg.saved.bytes', sum(saved.values()))
+
+        # atlas index: the f:N group of every layer frame
+        if self.type == SVGDocument.Type.ATLAS:
+            logging.info("<SVG> Exporting atlas index to {}.atlas.json".format(self.swf.alias))
+            sink.write('{}.atlas.json'.format(self.swf.alias),
+                       json.dumps({'file': '{}.svg'.format(self.swf.alias), 'layers': self.atlas}, indent=2, sort_keys=True))
+            files['{}.atlas.json'.format(self.swf.alias)] = files['{}.svg'.format(self.swf.alias)]
+        self.report.count('svg.exported', len(pending))
+        self.report.count('svg.bytes', sum(sink.size(file) for file in files))
+        return files
+
+    def getExportKey(self, task):
+        # hash of the raw [DefineShape]/[DefineSprite]/[PlaceObject] tags the file is made of
+        file, method, target = task
+        index = self.swf.getTagIndex()
+        parts = [method, file] + (['styles'] if self.styles else []) + (self.compaction.key() if self.compaction else [])
+        if target == None:
+            parts.append(index.body)
+        else:
+            for frame in SVGDocument.getFrames(target):
+                char = self.swf.getCharacterById(frame.id)
+                parts += [index.getDefinition(char.id), index.getPlacement(char.id)]
+                if isinstance(char, SWFDocument.Sprite):
+                    parts.append(index.getDefinition(char.shape.id))
+            # pyswf writes every shape of the SWF to the defs of a file, placed
+            # or not, only the atlas has just its own
+            if method != 'export_atlas':
+                parts.append(self.getDefinitionsKey())
+        return ConversionCache.key(parts)
+
+    def getDefinitionsKey(self):
+        if self.definitionsKey == None:
+            index = self.swf.getTagIndex()
+            self.definitionsKey = ConversionCache.key([index.getDefinition(id) for id in sorted(index.characters)])
+        return self.definitionsKey
+
+    def getExportTasks(self, sink):
+        # [(file, exporter method, target)] in export order
+        tasks = []
+        self.assets = {}
+        exported = {}
+        def addTask(file, method, target, message, asset):
+            # shapes equal to an exported one just point to its file
+            key = None
+            if self.deduplicate and target != None:
+                key = self.getTaskKey(method, target)
+            if key in exported:
+                logging.info("<SVG> %s is the same as %s, skipping", file, exported[key])
+                self.report.count('svg.deduplicated')
+                file = exported[key]
+            else:
+                logging.info(message)
+                tasks.append((file, method, target))
+                if key != None: exported[key] = file
+            self.assets.setdefault(asset, []).append(file)
 
         if self.type == SVGDocument.Type.DEPTH:
             for layer in self.layers:
                 if (len(layer.frames) > 1):
-                    logging.info("<SVG> Exporting animated layer {} to {}_f.svg".format(layer,layer))
-                    open('{}/{}_f.svg'.format(folder,layer), 'wb').write(self.exporter.export_layer(layer, self.swf).read())
+                    addTask('{}_f.svg'.format(layer), 'export_layer', layer,
+                            "<SVG> Exporting animated layer {} to {}_f.svg".format(layer,layer), str(layer))
                 else:
-                    logging.info("<SVG> Exporting layer {} to {}.svg".format(layer,layer))
-                    open('{}/{}.svg'.format(folder,layer), 'wb').write(self.exporter.export_layer(layer, self.swf).read())
+                    addTask('{}.svg'.format(layer), 'export_layer', layer,
+                            "<SVG> Exporting layer {} to {}.svg".format(layer,layer), str(layer))
 
         elif self.type == SVGDocument.Type.DEPTH_MULTI:
             for layer in self.layers:
                 if (len(layer.frames) > 1):
                     for f, frame in enumerate(layer.frames):
-                        logging.info("<SVG> Exporting layer {} frame {} to {}_{}.svg".format(layer,f,layer,f))
-                        open('{}/{}_{}.svg'.format(folder,layer,f), 'wb').write(self.exporter.export_frame(frame, self.swf).read())
+                        addTask('{}_{}.svg'.format(layer,f), 'export_frame', frame,
+                                "<SVG> Exporting layer {} frame {} to {}_{}.svg".format(layer,f,layer,f), str(layer))
                 else:
-                    logging.info("<SVG> Exporting layer {} to {}.svg".format(layer,layer))
-                    open('{}/{}.svg'.format(folder,layer), 'wb').write(self.exporter.export_layer(layer, self.swf).read())
+                    addTask('{}.svg'.format(layer), 'export_layer', layer,
+                            "<SVG> Exporting layer {} to {}.svg".format(layer,layer), str(layer))
+
+        elif self.type == SVGDocument.Type.ATLAS:
+            chars = self.getAtlas()
+            addTask('{}.svg'.format(self.swf.alias), 'export_atlas', chars,
+                    "<SVG> Exporting {} frames of {} layers to {}.svg".format(len(chars), len(self.layers), self.swf.alias), self.swf.alias)
 
         elif self.type == SVGDocument.Type.SHAPE:
             for shape in self.swf.shapes:
-                logging.info("<SVG> Exporting shape {} to {}.svg".format(shape,shape.id))
-                open('{}/{}.svg'.format(folder,shape.id), 'wb').write(self.exporter.export_shape(shape, self.swf).read())
+                addTask('{}.svg'.format(shape.id), 'export_shape', shape,
+                        "<SVG> Exporting shape {} to {}.svg".format(shape,shape.id), str(shape.id))
 
         elif self.type == SVGDocument.Type.ALL:
-            logging.info("<SVG> Exporting all frames to {}/{}.svg".format(folder,self.swf.alias))
-            open('{}/{}.svg'.format(folder,self.swf.alias), 'wb').write(self.exporter.export_all(self.swf).read())
+            addTask('{}.svg'.format(self.swf.alias), 'export_all', None,
+                    "<SVG> Exporting all frames to {}/{}.svg".format(sink,self.swf.alias), self.swf.alias)
+        return tasks
+
+    def exportTask(self, exporter, task):
+        file, method, target = task
+        if target == None:
+            svg = getattr(exporter, method)(self.swf)
+        else:
+            svg = getattr(exporter, method)(target, self.swf)
+        return file, svg.read(), exporter.saved
+
+    def dumpInventory(self, dump):
+        for layer in self.layers:
+            dump.write('layer', name=str(layer.name), frames=[frame.id for frame in layer.frames],
+                       shapes=[self.shapeKeys.get(frame.id) for frame in layer.frames] if self.deduplicate else None)
+
+##
+#   Parallel export workers
+#   (the pool is started after _export is set, so forked workers share the parsed
+#   document; spawned ones, on Windows, parse the SWF again from the initializer's
+#   arguments. They send the .svg back, only the parent writes to the sink)
+
+_export = {}
+
+def _initExportWorker(file, depthNames, lazy, type, deduplicate, styles, compaction):
+    if 'document' not in _export:
+        document = SVGDocument(SWFDocument(file, depthNames, lazy), type, deduplicate, styles, compaction)
+        _export.update(document=document, tasks=dict((task[0], task) for task in document.getExportTasks(document.swf.alias)))
+    _export['exporter'] = ComposedSVGExporter(_export['document'])
+
+def _exportTask(file):
+    return _export['document'].exportTask(_export['exporter'], _export['tasks'][file])
@@ -0,0 +1,246 @@
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import traceback
+from multiprocessing import Pool, cpu_count
+
+from config import ANIM_TEMPLATE, TERMINAL_LOG_LEVEL
+from swf_doc import SWFDocument
+from svg import SVGDocument, PathCompaction
+from anim import AnimDocument
+from cache import ConversionCache, Manifest
+from report import ConversionReport
+from dump import InventoryDump
+from sink import DirectorySink, ZipSink, TarSink
+
+rootFolder = os.path.dirname(os.path.abspath(__file__))
+
+##
+#   Conversion
+
+def getOutFolder(file, output=None):
+    alias = os.path.splitext(os.path.basename(file))[0]
+    return '{}/{}'.format(output if output else os.path.dirname(os.path.abspath(file)), alias)
+
+# options of a conversion job, the defaults of the command line flags
+OPTIONS = {'svgJobs': 1, 'cache': None, 'deduplicate': False, 'animOnly': False,
+           'profile': False, 'tracemalloc': False, 'dump': False,
+           'tables': False, 'atlas': False,
+           'styles': False, 'compact': False, 'precision': PathCompaction.PRECISION,
+           'archive': None}
+
+def getSink(outFolder, options):
+    if options['archive'] == 'zip':
+        return ZipSink('{}.zip'.format(outFolder))
+    elif options['archive'] == 'tar':
+        return TarSink('{}.tar'.format(outFolder))
+    # with a cache the folder is updated in place, see Manifest
+    return DirectorySink(outFolder, clean=not options['cache'])
+
+def getResult(file, output):
+    return {'file': file, 'output': output, 'ok': False, 'error': None, 'time': 0, 'cache': None, 'stages': None}
+
+def convert(job):
+    """
+    Converts a single .swf into its own output folder or archive.
+    Returns a summary dict for the report.
+    """
+    file, outFolder, options = job
+    try:
+        sink = getSink(outFolder, options)
+    except (IOError, OSError) as e:
+        # nowhere to log to, the error goes to the report
+        result = getResult(file, outFolder)
+        result['error'] = '{}: {}'.format(e.__class__.__name__, e)
+        return result
+    try:
+        return convertTo(file, sink, options)
+    finally:
+        sink.close()
+
+def convertTo(file, sink, options):
+    """
+    Converts a single .swf to an OutputSink, logging to the sink's
+    conversion.log only. The sink is left open.
+    """
+    cacheFolder = options['cache']
+    result = getResult(file, str(sink))
+    start = time.time()
+    cache = ConversionCache(cacheFolder) if cacheFolder else None
+
+    # isolate the log of this file from the terminal and other conversions
+    logger = logging.getLogger()
+    handlers = logger.handlers[:]
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logfile = logging.StreamHandler(sink.open('conversion.log'))
+    logfile.setLevel(logging.DEBUG)
+    logfile.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(logfile)
+    logger.setLevel(logging.DEBUG)
+
+    report = ConversionReport(profile=options['profile'], memory=options['tracemalloc'])
+    report.start()
+    try:
+        swf = SWFDocument(file, lazy=True, report=report)
+        svg = SVGDocument(swf, type=SVGDocument.Type.ATLAS if options['atlas'] else SVGDocument.Type.DEPTH_MULTI,
+                          deduplicate=options['deduplicate'], styles=options['styles'],
+                          compaction=PathCompaction(options['precision']) if options['compact'] else None)
+        anim = AnimDocument(swf, svg, cache=cache, tables=options['tables'])
+        manifest = Manifest(sink) if cache else None
+        if options['animOnly']:
+            # keep the .svg files of previous conversions
+            files = dict(manifest.files) if cache else {}
+        else:
+            files = svg.export(sink, jobs=options['svgJobs'], cache=cache, manifest=manifest)
+        anim.export(rootFolder, sink)
+        if options['tables']:
+            anim.exportTables(sink)
+        if cache:
+            files['{}.anim'.format(swf.alias)] = anim.getKey()
+            files.pop('{}.table.bytes'.format(swf.alias), None)
+            if options['tables']:
+                files['{}.table.bytes'.format(swf.alias)] = anim.getKey()
+            # the index of deduplicated shapes goes with the .svg files it lists
+            files.pop('{}.assets.json'.format(swf.alias), None)
+            if svg.deduplicate:
+                files['{}.assets.json'.format(swf.alias)] = ConversionCache.key([svg.assets])
+            manifest.save(files, anim.depthKeys)
+            result['cache'] = (cache.hits, cache.misses)
+            report.set('cache.hits', cache.hits)
+            report.set('cache.misses', cache.misses)
+        if options['dump']:
+            dump = InventoryDump(sink)
+            for document in (swf, svg, anim):
+                document.dumpInventory(dump)
+            dump.close()
+        result['ok'] = True
+    except Exception as e:
+        logging.error(traceback.format_exc())
+        result['error'] = '{}: {}'.format(e.__class__.__name__, e)
+    finally:
+        report.stop()
+        report.set('ok', result['ok'])
+        report.save(sink)
+        result['stages'] = report.stages
+        logger.removeHandler(logfile)
+        logfile.close()
+        logfile.stream.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    result['time'] = time.time() - start
+    return result
+
+def expand(patterns):
+    # files and globs, in order, without repeats
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logging.warning('<swf2unity> No files match "{}"'.format(pattern))
+        for file in matches:
+            if os.path.abspath(file) not in seen:
+                seen.add(os.path.abspath(file))
+                files.append(file)
+    return files
+
+##
+#   MAIN
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='swf2unity', description='Converts .swf vector animations to .svg + Unity .anim')
+    parser.add_argument('files', nargs='+', help='.swf files or glob patterns')
+    parser.add_argument('-o', '--output', help='folder for the per-file output folders (default: next to each .swf)')
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(), help='parallel conversions (default: cpu count)')
+    parser.add_argument('--svg-jobs', type=int, default=1, help='parallel .svg exports per file (files are then converted one at a time)')
+    parser.add_argument('--archive', choices=['zip', 'tar'], help='write each conversion to a <name>.zip or <name>.tar instead of a folder')
+    parser.add_argument('--cache', metavar='FOLDER', help='reuse unchanged .svg files and curves from this cache folder')
+    parser.add_argument('--dedup', action='store_true', help='export equal shapes once and write an .assets.json index')
+    parser.add_argument('--styles', action='store_true', help='write equal fills, strokes and gradients once per .svg, as <style> classes')
+    parser.add_argument('--compact', action='store_true', help='rewrite path data with relative commands, fewer decimals and merged segments')
+    parser.add_argument('--precision', type=int, default=PathCompaction.PRECISION, help='decimals kept by --compact (default: %(default)s)')
+    parser.add_argument('--atlas', action='store_true', help='export every layer frame to a single .svg with an .atlas.json index')
+    parser.add_argument('--anim-only', action='store_true', help='only export the .anim, shapes are not decoded')
+    parser.add_argument('--tables', action='store_true', help='also bake the curves into a .table.bytes for SVGCurveTable')
+    parser.add_argument('--profile', action='store_true', help='write a cProfile conversion.prof next to each conversion.log')
+    parser.add_argument('--dump', action='store_true', help='write the tag, frame and curve inventory to conversion.dump.jsonl')
+    parser.add_argument('--tracemalloc', action='store_true', help='add the peak and top allocations to conversion.json (python 3)')
+    args = parser.parse_args(argv)
+    if args.svg_jobs > 1:
+        # pool workers can't start pools of their own
+        args.jobs = 1
+
+    setupLogging()
+
+    if args.output and not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    jobs = []
+    outFolders = {}
+    for file in expand(args.files):
+        outFolder = getOutFolder(file, args.output)
+        if outFolder in outFolders:
+            logging.error('<swf2unity> Skipping "{}", output folder "{}" already used by "{}"'.format(file, outFolder, outFolders[outFolder]))
+            continue
+        outFolders[outFolder] = file
+        jobs.append((file, outFolder, {'svgJobs': args.svg_jobs, 'cache': args.cache, 'deduplicate': args.dedup, 'animOnly': args.anim_only,
+                     'profile': args.profile, 'tracemalloc': args.tracemalloc, 'dump': args.dump,
+                     'tables': args.tables, 'atlas': args.atlas,
+                     'styles': args.styles, 'compact': args.compact, 'precision': args.precision,
+                     'archive': args.archive}))
+    if not jobs:
+        logging.error('<swf2unity> Nothing to convert')
+        return 1
+
+    logging.info('<swf2unity> Converting {} file(s) with {} job(s)'.format(len(jobs), args.jobs))
+    start = time.time()
+    results = []
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = Pool(min(args.jobs, len(jobs)), _initWorker)
+        try:
+            for result in pool.imap_unordered(convert, jobs):
+                report(result)
+                results.append(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            result = convert(job)
+            report(result)
+            results.append(result)
+
+    failed = [r for r in results if not r['ok']]
+    logging.info('<swf2unity> {} converted, {} failed in {:.2f}s'.format(len(results)-len(failed), len(failed), time.time()-start))
+    return 1 if failed else 0
+
+def setupLogging():
+    # terminal log, conversions log to their own conversion.log
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+    logstream = logging.StreamHandler()
+    logstream.setLevel(TERMINAL_LOG_LEVEL)
+    logstream.setFormatter(logging.Formatter('%(levelname)s\t%(message)s'))
+    logger.addHandler(logstream)
+
+def _initWorker():
+    # forked workers inherit the terminal log, spawned ones (Windows) start
+    # with nothing set up; both load the .anim template once, up front
+    if not logging.getLogger().handlers:
+        setupLogging()
+    AnimDocument.Template.load('{}/{}'.format(rootFolder, ANIM_TEMPLATE))
+
+def report(result):
+    if result['ok']:
+        cache = ' cache: {} hits, {} misses'.format(*result['cache']) if result['cache'] else ''
+        logging.info('<swf2unity> {} -> {} ({:.2f}s){}'.format(result['file'], result['output'], result['time'], cache))
+    else:
+        logging.error('<swf2unity> {} failed: {} (see {}/conversion.log)'.format(result['file'], result['error'], result['output']))
+
+if __name__ == '__main__':
+    sys.exit(main())
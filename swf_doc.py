@@ -1,6 +1,14 @@
+import zlib
+import mmap
+import struct
 import logging
-from swf.movie import SWF
+import tempfile
+from io import BytesIO
+from swf.movie import SWF, SWFHeader
+from swf.stream import SWFStream
+from swf.tag import TagFactory
 from model import TMatrix
+from report import ConversionReport
 
 class SWFDocument(object):
 
@@ -9,9 +17,15 @@ class SWFDocument(object):
 
     class Character(object):
         def __init__(self, tag):
-            self.tag = tag
+            self._tag = tag
             self.id = tag.characterId
             self.depth = -1
+        @property
+        def tag(self):
+            # shapes of a lazy SWF are decoded on first use
+            if isinstance(self._tag, SWFDocument.LazyTag):
+                self._tag = self._tag.decode()
+            return self._tag
         def nametag(self):
             return '[CHAR|{}]'.format(self.id)
 
@@ -48,6 +62,7 @@ class SWFDocument(object):
             return '[SPRITE|{}]'.format(self.id)
 
     class Transform(object):
+        __slots__ = ('f', 'char', 'depth')
         def __init__(self, f, char, depth):
             self.f = f
             self.char = char
@@ -56,20 +71,13 @@ class SWFDocument(object):
             return "[Transform] char:{} depth:{}".format(self.char, self.depth)
 
     class MatrixTransform(Transform):
+        __slots__ = ('matrix',)
         def __init__(self, f, char, depth, matrix):
             self.matrix = matrix
             super(SWFDocument.MatrixTransform, self).__init__(f, char, depth)
         def __str__(self):
             return "[MatrixTransform] char:{} depth:{} matrix:{}".format(self.char, self.depth, self.matrix)
 
-    class Frame(object):
-        @staticmethod
-        def addFrame(swf):
-            swf.frames.append([])
-        @staticmethod
-        def getFrame(swf, f):
-            return swf.frames[f]
-
     class Depth(object):
         @staticmethod
         def get(swf, depth):
@@ -91,50 +99,279 @@ class SWFDocument(object):
         def __str__(self):
             return "[Depth|{}]".format(self.id)
 
+    class TagIndex(object):
+        """
+        Raw tag headers (type, offset, length) of the decompressed SWF body,
+        for reading the original bytes of a tag without decoding it. The
+        body is a view of a memory mapped file, tags are sliced, not copied.
+        """
+        DEFINE_TYPES = (2, 22, 32, 83, 46, 84, 39)
+        PLACE_TYPES = (4, 26, 70)
+        # bytes decompressed at a time
+        CHUNK = 1 << 20
+
+        class Entry(object):
+            def __init__(self, type, offset, length):
+                self.type = type
+                self.offset = offset
+                self.length = length
+                self.tags = []
+            def __str__(self):
+                return "[Tag|{}] offset:{} length:{}".format(self.type, self.offset, self.length)
+
+        @staticmethod
+        def read(file):
+            # the SWF as an uncompressed file mapped in memory, compressed
+            # ones are decompressed once into a temporary file
+            input = open(file, 'rb')
+            header = input.read(8)
+            if header[:3] == b'CWS':
+                decompressor = zlib.decompressobj()
+            elif header[:3] == b'ZWS':
+                import pylzma
+                # compressed length
+                input.read(4)
+                decompressor = pylzma.decompressobj()
+            else:
+                return mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_READ)
+            temp = tempfile.TemporaryFile()
+            temp.write(b'F' + header[1:])
+            for chunk in iter(lambda: input.read(SWFDocument.TagIndex.CHUNK), b''):
+                temp.write(decompressor.decompress(chunk))
+            temp.write(decompressor.flush())
+            temp.flush()
+            return mmap.mmap(temp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        @staticmethod
+        def view(data, offset, length = None):
+            # python 2 mmaps have no memoryview, only the old buffer interface,
+            # whose slices are copies: the view is made with its length instead
+            try:
+                return memoryview(data)[offset:None if length == None else offset + length]
+            except TypeError:
+                return buffer(data, offset) if length == None else buffer(data, offset, length)
+
+        def __init__(self, data):
+            # data: uncompressed SWF file, body after the 8 byte header
+            self.data = data
+            self.body = body = SWFDocument.TagIndex.view(data, 8)
+            # skip frame size RECT, frame rate and frame count
+            bits = struct.unpack_from('B', body, 0)[0] >> 3
+            self.start = (5 + 4*bits + 7)//8 + 4
+            self.tags = self.readTags(self.start, len(body))
+            self.characters = {}
+            self.placements = {}
+            for entry in self.tags:
+                self.indexTag(entry)
+            for entry in self.tags:
+                for child in entry.tags:
+                    self.indexTag(child)
+
+        def readTags(self, pos, end):
+            tags = []
+            while pos + 2 <= end:
+                header = struct.unpack_from('<H', self.body, pos)[0]
+                length = header & 0x3f
+                pos += 2
+                if length == 0x3f:
+                    length = struct.unpack_from('<i', self.body, pos)[0]
+                    pos += 4
+                entry = SWFDocument.TagIndex.Entry(header >> 6, pos, length)
+                # [DefineSprite] spriteId, frameCount, tags
+                if entry.type == 39:
+                    entry.tags = self.readTags(pos + 4, pos + length)
+                tags.append(entry)
+                pos += length
+                # [End]
+                if entry.type == 0: break
+            return tags
+
+        def indexTag(self, entry):
+            if entry.type in SWFDocument.TagIndex.DEFINE_TYPES:
+                self.characters.setdefault(struct.unpack_from('<H', self.body, entry.offset)[0], entry)
+            elif entry.type in SWFDocument.TagIndex.PLACE_TYPES:
+                id = self.getPlacedCharacterId(entry)
+                if id != None: self.placements.setdefault(id, entry)
+
+        def getPlacedCharacterId(self, entry):
+            # [PlaceObject] characterId, depth, ...
+            if entry.type == 4:
+                return struct.unpack_from('<H', self.body, entry.offset)[0]
+            # [PlaceObject2] flags, depth, characterId?, ...
+            flags = struct.unpack_from('B', self.body, entry.offset)[0]
+            if not flags & 0x02: return None
+            if entry.type == 26:
+                return struct.unpack_from('<H', self.body, entry.offset + 3)[0]
+            # [PlaceObject3] flags, flags3, depth, className?, characterId?, ...
+            flags3 = struct.unpack_from('B', self.body, entry.offset + 1)[0]
+            pos = entry.offset + 4
+            if flags3 & 0x08 or flags3 & 0x10:
+                pos = self.data.find(b'\0', 8 + pos) + 1 - 8
+            return struct.unpack_from('<H', self.body, pos)[0]
+
+        def getBytes(self, entry):
+            if entry == None: return None
+            return SWFDocument.TagIndex.view(self.data, 8 + entry.offset, entry.length)
+
+        def getDefinition(self, id):
+            return self.getBytes(self.characters.get(id))
+
+        def getPlacement(self, id):
+            return self.getBytes(self.placements.get(id))
+
+        def getStream(self, entry):
+            # pyswf reads the tag straight from the mapped file
+            self.data.seek(8 + entry.offset)
+            return SWFStream(self.data)
+
+        def decode(self, entry):
+            # pyswf tag of an entry, None for tags pyswf doesn't know
+            tag = TagFactory.create(entry.type)
+            if tag != None:
+                tag.parse(self.getStream(entry), entry.length, tag.version)
+            return tag
+
+    class LazyTag(object):
+        """
+        Shape definition read up to its bounds, decoded the first time the
+        shape itself is needed.
+        """
+        def __init__(self, index, entry):
+            self.index = index
+            self.entry = entry
+            self.type = entry.type
+            self.decoded = None
+            # [DefineShape*] id, shapeBounds, ... [DefineMorphShape*] id, startBounds, ...
+            stream = index.getStream(entry)
+            self.characterId = stream.readUI16()
+            self.shape_bounds = stream.readRECT()
+            self.startBounds = self.shape_bounds
+        def decode(self):
+            if self.decoded == None:
+                self.decoded = self.index.decode(self.entry)
+                if self.type in SWFDocument.LazySWF.MORPH_TYPES:
+                    self.decoded.shape_bounds = self.decoded.startBounds
+            return self.decoded
+        def __str__(self):
+            return "[LazyTag|{}] characterId:{} length:{}".format(self.type, self.characterId, self.entry.length)
+
+    class LazySWF(SWF):
+        """
+        pyswf SWF built from a TagIndex, with the shape definitions left as
+        LazyTags in headerTags. Reading tags decodes all of them.
+        """
+        SHAPE_TYPES = (2, 22, 32, 83, 46, 84)
+        MORPH_TYPES = (46, 84)
+
+        def __init__(self, file, index):
+            super(SWFDocument.LazySWF, self).__init__()
+            # header of the uncompressed file, so frame size, rate and count are read
+            signature = open(file, 'rb').read(3)
+            self._header = SWFHeader(SWFStream(BytesIO(index.data[:8 + index.start])))
+            self._header._compressed_zlib = signature[:1] == b'C'
+            self._header._compressed_lzma = signature[:1] == b'Z'
+            self.headerTags = []
+            for entry in index.tags:
+                if entry.type in SWFDocument.LazySWF.SHAPE_TYPES:
+                    self.headerTags.append(SWFDocument.LazyTag(index, entry))
+                else:
+                    tag = index.decode(entry)
+                    if tag != None: self.headerTags.append(tag)
+            self._tags = None
+
+        @property
+        def tags(self):
+            if self._tags == None:
+                self._tags = [tag.decode() if isinstance(tag, SWFDocument.LazyTag) else tag for tag in self.headerTags]
+            return self._tags
+
+        @tags.setter
+        def tags(self, tags):
+            self._tags = tags
+
+        def __str__(self):
+            s = "[SWF]\n"
+            s += self._header.__str__()
+            for tag in self.headerTags:
+                s += tag.__str__() + "\n"
+            return s
+
     ##
     #   constructor
 
-    def __init__(self, file, depthNames={}):
+    def __init__(self, file, depthNames={}, lazy=False, report=None):
         self.depthNames = depthNames
+        # stage timers and counters, shared with the SVG and Anim documents
+        self.report = report if report != None else ConversionReport()
         # load and parse the SWF
         logging.info("<SWF> Starting parse...")
-        self.swf = SWF(open(file, 'rb'))
+        self.file = file
+        self.lazy = lazy
+        self.tagIndex = None
+        with self.report.stage('swf.parse'):
+            if lazy:
+                # only tag headers and the timeline, shapes are decoded on export
+                self.swf = SWFDocument.LazySWF(file, self.getTagIndex())
+            else:
+                self.swf = SWF(open(file, 'rb'))
         self.alias = file.split('.')[0].split('/')[-1];
         self.frameRate = self.swf.header.frame_rate
         self.frameCount = self.swf.header.frame_count
 
-        # Debug
-        logging.debug(self.swf)
-
         # Document ELements
         self.shapes = []
         self.sprites = []
-        self.frames = []
         self.depths = {}
+        self.parsed = False
 
-        for _ in range(self.frameCount):
-            SWFDocument.Frame.addFrame(self)
+        # Character registry (id -> char, depth -> char)
+        self.charactersById = {}
+        self.charactersByDepth = {}
 
-        # Parse
-        self.parse()
+        # Parse characters and depths, transforms are streamed by parse()
+        with self.report.stage('swf.parse'):
+            for f, transforms in self.parse():
+                self.report.count('swf.frames')
+                self.report.count('swf.transforms', len(transforms))
+        self.parsed = True
+        self.report.set('swf.tags', len(self.swf.headerTags if self.lazy else self.swf.tags))
+        self.report.set('swf.shapes', len(self.shapes))
+        self.report.set('swf.sprites', len(self.sprites))
+        self.report.set('swf.depths', len(self.depths))
 
     ##
     #   PARSING
 
     def parse(self):
+        """
+        Walks the timeline yielding (f, transforms) on every [ShowFrame], so
+        only one frame of transforms is alive at a time. Characters are
+        created on the first walk, each walk starts from an empty stage.
+        """
         logging.info("<SWF> Starting parsing...")
 
+        for depth in self.depths.values():
+            depth.removeChar()
+        for char in self.charactersById.values():
+            char.depth = -1
+        self.charactersByDepth = {}
+
         f = 0
+        transforms = []
         lastDefinedShape = None
         lastDefinedSprite = None
-        for tag in self.swf.tags:
+        for tag in (self.swf.headerTags if self.lazy else self.swf.tags):
+
+            if self.parsed and tag.type in SWFDocument.TagIndex.DEFINE_TYPES:
+                continue
 
             # [DefineShape], [DefineShape2], [DefineShape3], [DefineShape4]
             if (tag.type == 2 or tag.type == 22 or tag.type == 32 or tag.type == 83):
                 # Create shape model
                 lastDefinedShape = SWFDocument.Shape(tag)
-                logging.info("<SWF> {} created".format(lastDefinedShape))
+                logging.info("<SWF> %s created", lastDefinedShape)
                 self.shapes.append(lastDefinedShape)
+                self.registerCharacter(lastDefinedShape)
 
             # [DefineSprite]
             elif (tag.type == 39):
@@ -145,14 +382,16 @@ class SWFDocument(object):
                         lastDefinedSprite.matrix = tagtag.matrix.to_array()
                         break
                     print(tagtag)
-                logging.info("<SWF> {} created".format(lastDefinedSprite))
+                logging.info("<SWF> %s created", lastDefinedSprite)
                 self.sprites.append(lastDefinedSprite)
+                self.registerCharacter(lastDefinedSprite)
 
             # [DefineMorphShape]
             elif tag.type == 46:
                 lastDefinedShape = self.MorphShape(tag)
-                logging.info("<SWF> {} created".format(lastDefinedShape))
+                logging.info("<SWF> %s created", lastDefinedShape)
                 self.shapes.append(lastDefinedShape)
+                self.registerCharacter(lastDefinedShape)
 
             # [PlaceObject2]
             elif (tag.type == 26):
@@ -166,26 +405,26 @@ class SWFDocument(object):
                         char = depth.char
                         # If another char is in this depth, remove it (also add frame to update depth)
                         if (char != None and char.id != tag.characterId):
-                            logging.debug("<SWF> Removing >{}< from {}".format(char,depth))
-                            char.depth = None
+                            logging.debug("<SWF> Removing >%s< from %s", char, depth)
+                            self.setCharacterDepth(char, None)
                             depth.removeChar()
-                            self.frames[f].append(SWFDocument.Transform(f, None, depth))
+                            transforms.append(SWFDocument.Transform(f, None, depth))
                         # Find new char and set depth
                         char = self.getCharacterById(tag.characterId)
                         if (char != None):
-                            logging.debug("<SWF> Moving >{}< to {}".format(char,depth))
-                            char.depth = depth
+                            logging.debug("<SWF> Moving >%s< to %s", char, depth)
+                            self.setCharacterDepth(char, depth)
                             depth.setChar(char)
-                            self.frames[f].append(SWFDocument.MatrixTransform(f, char, depth, TMatrix(tag.matrix.to_array())))
+                            transforms.append(SWFDocument.MatrixTransform(f, char, depth, TMatrix(tag.matrix.to_array())))
                         else:
-                            logging.error("<SWF> Couldn't find [Char|{}]".format(tag.characterId))
+                            logging.error("<SWF> Couldn't find [Char|%s]", tag.characterId)
                     # Remove character in the current depth
                     else:
                         char = depth.char
-                        logging.debug("<SWF> Removing >{}< from {}".format(char,depth))
-                        char.depth = None
+                        logging.debug("<SWF> Removing >%s< from %s", char, depth)
+                        self.setCharacterDepth(char, None)
                         depth.removeChar()
-                        self.frames[f].append(SWFDocument.Transform(f, None, depth))
+                        transforms.append(SWFDocument.Transform(f, None, depth))
                 else:
                     if not tag.hasMove:
                         logging.error("<SWF> I don't really know what was supposed to happen here; docs says it should crash. Savage.")
@@ -199,50 +438,77 @@ class SWFDocument(object):
                             if (isinstance(char,SWFDocument.Sprite)): matrix = matrix * char.matrix
                             elif (isinstance(char,SWFDocument.Shape)): matrix = matrix * char.getCenterMatrix()
 
-                        logging.debug("<SWF> f{} >{}< matrix: {}, {}".format(f, char, matrix, depth))
-                        self.frames[f].append(SWFDocument.MatrixTransform(f, char, depth, matrix))
+                        transforms.append(SWFDocument.MatrixTransform(f, char, depth, matrix))
 
             # [ShowFrame]
             elif (tag.type == 1 and f < self.frameCount):
-                logging.debug("<SWF> Show frame: {}".format(f))
+                yield f, transforms
+                transforms = []
                 f += 1;
 
-        ## Debug Output
-        logging.debug("<SWF> Shapes:")
-        for shape in self.shapes:
-            logging.debug('\t{}'.format(shape))
-        logging.debug("<SWF> Sprites:")
-        for sprite in self.sprites:
-            logging.debug('\t{}'.format(sprite))
-        logging.debug("<SWF> Frames:")
-        for f, frame in enumerate(self.frames):
-            logging.debug("\t[frame{}]".format(f))
-            for t, transform in enumerate(frame):
-                logging.debug("\t\t{}".format(transform))
-        logging.debug("<SWF> Depths:")
-        for d, depth in self.depths.iteritems():
-            logging.debug("\t{}".format(depth))
-            logging.debug("\tname: {}".format(depth.name))
-            logging.debug("\thistory:")
-            for c, char in enumerate(depth.charHistory):
-                logging.debug("\t\t{}".format(char))
+        if transforms:
+            if f < self.frameCount:
+                yield f, transforms
+            else:
+                logging.warning("<SWF> Ignoring %s transforms after the last frame", len(transforms))
+
+    def registerCharacter(self, char):
+        # shapes take precedence over sprites with the same id
+        if char.id in self.charactersById:
+            if not isinstance(char, SWFDocument.Shape) or isinstance(self.charactersById[char.id], SWFDocument.Shape):
+                return
+        self.charactersById[char.id] = char
+
+    def setCharacterDepth(self, char, depth):
+        if char.depth in self.charactersByDepth and self.charactersByDepth[char.depth] is char:
+            del self.charactersByDepth[char.depth]
+        char.depth = depth
+        if depth != None:
+            self.charactersByDepth[depth] = char
+
+    def getTagIndex(self):
+        if self.tagIndex == None:
+            self.tagIndex = SWFDocument.TagIndex(SWFDocument.TagIndex.read(self.file))
+        return self.tagIndex
 
     def getCharacterById(self, id):
-        shape = [s for s in self.shapes if s.id == id]
-        sprite = [s for s in self.sprites if s.id == id]
-        if (len(shape)): return shape[0]
-        elif (len(sprite)): return sprite[0]
-        else: return None
+        return self.charactersById.get(id, None)
 
     def getCharacterByDepth(self, depth):
-        shape = [s for s in self.shapes if s.depth == depth]
-        sprite = [s for s in self.sprites if s.depth == depth]
-        if (len(shape)): return shape[0]
-        elif (len(sprite)): return sprite[0]
-        else: return None
+        return self.charactersByDepth.get(depth, None)
 
     def getDepthName(self, depth):
         if depth in self.depthNames:
             return self.depthNames[depth]
         else:
             return depth
+
+    def dumpInventory(self, dump):
+        # tags, characters, depths and every frame of transforms, see InventoryDump
+        index = self.getTagIndex()
+        dump.write('swf', file=self.file, alias=self.alias, version=self.swf.header.version,
+                   frameRate=self.frameRate, frameCount=self.frameCount)
+        names = {}
+        def writeTags(tags, sprite=None):
+            for entry in tags:
+                if entry.type not in names:
+                    tag = TagFactory.create(entry.type)
+                    names[entry.type] = tag.name if tag != None else None
+                dump.write('tag', tag=entry.type, name=names[entry.type], offset=entry.offset, length=entry.length, sprite=sprite)
+                if entry.tags:
+                    writeTags(entry.tags, struct.unpack_from('<H', index.body, entry.offset)[0])
+        writeTags(index.tags)
+        for shape in self.shapes:
+            bounds = shape.bounds
+            dump.write('shape', id=shape.id, morph=isinstance(shape, SWFDocument.MorphShape),
+                       bounds=[bounds.xmin, bounds.xmax, bounds.ymin, bounds.ymax])
+        for sprite in self.sprites:
+            dump.write('sprite', id=sprite.id, shape=sprite.shape.id, frameCount=sprite.frameCount, matrix=sprite.matrix)
+        for d, depth in sorted(self.depths.items()):
+            dump.write('depth', id=depth.id, name=str(depth.name), chars=[char.id for char in depth.charHistory])
+        for f, transforms in self.parse():
+            dump.write('frame', f=f, transforms=[{
+                'depth': t.depth.id,
+                'char': t.char.id if t.char != None else None,
+                'matrix': t.matrix.matrix if isinstance(t, SWFDocument.MatrixTransform) and t.matrix != None else None
+            } for t in transforms])
@@ -0,0 +1,118 @@
+import os
+import sys
+import zlib
+import struct
+import shutil
+import logging
+import tempfile
+import unittest
+
+# Export keys and deduplication of SVGDocument, on SWFs written with
+# benchmarks/synthetic.py
+# usage: python -m unittest discover -s tests
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootFolder)
+sys.path.insert(0, '{}/benchmarks'.format(rootFolder))
+
+import synthetic
+from swf_doc import SWFDocument
+from svg import SVGDocument, PathCompaction, _export, _initExportWorker, _exportTask
+
+logging.disable(logging.CRITICAL)
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, data):
+        # same file name, it's part of the keys
+        if not os.path.exists('{}/{}'.format(self.folder, name)):
+            os.makedirs('{}/{}'.format(self.folder, name))
+        file = '{}/{}/sample.swf'.format(self.folder, name)
+        open(file, 'wb').write(data)
+        return file
+
+    def replace(self, data, old, new):
+        # the SWF with one tag replaced, compressed again like synthetic's
+        body = zlib.decompress(data[8:])
+        self.assertIn(old, body)
+        body = body.replace(old, new)
+        return data[:4] + struct.pack('<I', 8 + len(body)) + zlib.compress(body)
+
+    def getKeys(self, file, type):
+        svg = SVGDocument(SWFDocument(file), type)
+        return dict((task[0], svg.getExportKey(task)) for task in svg.getExportTasks(self.folder))
+
+    def test_unplaced_shape_key(self):
+        # 2 of 3 shapes placed, the third one is still in the defs of every file
+        data = synthetic.generate(3, 2, 3)
+        changed = self.replace(data, synthetic.defineShape(3, 440, (80, 180, 44)), synthetic.defineShape(3, 440, (0, 0, 0)))
+        for type in (SVGDocument.Type.DEPTH, SVGDocument.Type.DEPTH_MULTI, SVGDocument.Type.SHAPE):
+            keys = self.getKeys(self.write('before', data), type)
+            changedKeys = self.getKeys(self.write('after', changed), type)
+            self.assertEqual(sorted(keys), sorted(changedKeys))
+            for file in keys:
+                self.assertNotEqual(keys[file], changedKeys[file], file)
+
+    def test_atlas_key(self):
+        # the atlas only has the placed shapes
+        data = synthetic.generate(3, 2, 3)
+        changed = self.replace(data, synthetic.defineShape(3, 440, (80, 180, 44)), synthetic.defineShape(3, 440, (0, 0, 0)))
+        self.assertEqual(self.getKeys(self.write('before', data), SVGDocument.Type.ATLAS),
+                         self.getKeys(self.write('after', changed), SVGDocument.Type.ATLAS))
+
+    def place(self, depth, id, scale, x, y):
+        # [PlaceObject2] a character with a scale and position, in place of the depth's one if any
+        writer = synthetic.BitWriter()
+        synthetic.matrix(writer, [scale, scale], [0, 0], x, y)
+        return synthetic.tag(26, struct.pack('<BHH', 0x06, depth, id) + writer.bytes())
+
+    def getTwoDepths(self, second):
+        # shapes 1 and 2 are equal, depth 1 places 1 and depth 2 places 2 with
+        # the second (scale, x, y), both then change to shape 3 on frame 1
+        tags = [synthetic.defineShape(id, 400, (200, 90, 150)) for id in (1, 2)] + [synthetic.defineShape(3, 600, (0, 90, 150))]
+        tags += [self.place(1, 1, 1, 2000, 2000), self.place(2, 2, *second), synthetic.tag(1)]
+        tags += [self.place(1, 3, 1, 2000, 2000), self.place(2, 3, 1, 2000, 2000), synthetic.tag(1), synthetic.tag(0)]
+        writer = synthetic.BitWriter()
+        synthetic.rect(writer, 0, 8000, 0, 8000)
+        body = writer.bytes() + struct.pack('<HH', 24 << 8, 2) + b''.join(tags)
+        return b'CWS' + struct.pack('<BI', 10, 8 + len(body)) + zlib.compress(body)
+
+    def getFiles(self, data, type):
+        svg = SVGDocument(SWFDocument(self.write('sample', data)), type, deduplicate=True)
+        return [task[0] for task in svg.getExportTasks(self.folder)], svg.assets
+
+    def test_dedup_placements(self):
+        # frame 0 of both layers draws the same shape, once with another matrix
+        for second, files in (((1, 2000, 2000), 2), ((1, 4000, 2000), 3), ((2, 2000, 2000), 3)):
+            tasks, assets = self.getFiles(self.getTwoDepths(second), SVGDocument.Type.DEPTH_MULTI)
+            self.assertEqual(len(tasks), files, second)
+            self.assertEqual(len(set(file for layer in assets for file in assets[layer])), files, second)
+
+    def test_dedup_atlas(self):
+        # the atlas centers every shape, shapes 1 and 2 share a group wherever they're placed
+        svg = SVGDocument(SWFDocument(self.write('sample', self.getTwoDepths((2, 4000, 2000)))), SVGDocument.Type.ATLAS, deduplicate=True)
+        self.assertEqual(len(svg.getAtlas()), 2)
+
+    def test_spawned_worker(self):
+        # a worker that inherits nothing, like the spawned ones on Windows,
+        # parses the SWF again and exports the same files
+        file = self.write('sample', synthetic.generate(3, 4, 2, gradients=True))
+        compaction = PathCompaction(1)
+        document = SVGDocument(SWFDocument(file), SVGDocument.Type.DEPTH, True, True, compaction)
+        tasks = document.getExportTasks(self.folder)
+        _export.clear()
+        try:
+            _initExportWorker(file, {}, False, SVGDocument.Type.DEPTH, True, True, compaction)
+            for task in tasks:
+                self.assertEqual(_exportTask(task[0]), document.exportTask(document.exporter, task))
+        finally:
+            _export.clear()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import glob
+import json
+import logging
+import unittest
+import yaml
+
+# Curves of every sample in tests/*.swf after Curve.optimize, compared with
+# the .anim files the multi-pass optimize wrote before it became a single
+# pass (tests/baseline/<name>.anim)
+# usage: python -m unittest discover -s tests
+
+rootFolder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, rootFolder)
+
+from swf_doc import SWFDocument
+from svg import SVGDocument
+from anim import AnimDocument
+from sink import DictSink
+
+BASELINE = '{}/tests/baseline'.format(rootFolder)
+
+logging.disable(logging.CRITICAL)
+
+def loadCurves(data):
+    # curves of an .anim by tag, without the unity header and in a stable
+    # order: depths aren't written in the same order from run to run
+    clip = yaml.safe_load(data.split('\n', 3)[3])['AnimationClip']
+    return dict((tag, sorted(json.dumps(curve, sort_keys=True) for curve in clip[tag]))
+                for tag in clip if tag.endswith('Curves') and isinstance(clip[tag], list))
+
+class OptimizeTest(unittest.TestCase):
+
+    def check(self, file):
+        alias = os.path.splitext(os.path.basename(file))[0]
+        baseline = '{}/{}.anim'.format(BASELINE, alias)
+        if not os.path.exists(baseline):
+            self.skipTest('no baseline, {} did not convert before'.format(alias))
+        swf = SWFDocument(file)
+        anim = AnimDocument(swf, SVGDocument(swf))
+        sink = DictSink()
+        anim.export(rootFolder, sink)
+        self.assertEqual(loadCurves(sink.read('{}.anim'.format(alias))), loadCurves(open(baseline, 'rb').read()))
+
+# one test per sample
+for file in sorted(glob.glob('{}/tests/*.swf'.format(rootFolder))):
+    name = 'test_{}'.format(os.path.splitext(os.path.basename(file))[0])
+    setattr(OptimizeTest, name, lambda self, file=file: self.check(file))
+
+if __name__ == '__main__':
+    unittest.main()